@@ -1,15 +1,72 @@
+from django.conf import settings
 from django.db import transaction
-import requests
+import logging
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from .nbb_api import get_client, get_references, get_accounting_data
+from .models import (
+    Company, AnnualAccount, FinancialRubric, Administrator, Person, Participation, kpi_rubrics_prefetch,
+)
+from .kpis import build_kpis, store_kpis
+
+logger = logging.getLogger(__name__)
+
+
+def extract_deposit(accounting_data):
+    """Keep only the parts of an NBB deposit that the importer writes."""
+    return {
+        "rubrics": [
+            (r.get('Code'), r.get('Value'))
+            for r in accounting_data.get('Rubrics', [])
+            if r.get('Period') == 'N'
+        ],
+        "administrators": accounting_data.get('Administrators', {}),
+        "participations": accounting_data.get('ParticipatingInterests', []),
+    }
+
+
+def fetch_deposits(references, counter=None):
+    """
+    Download and extract the given deposits concurrently.
+
+    The pool is bounded by the NBB client's concurrency limit, which also
+    enforces the request rate budget. Returns the extracts keyed by
+    reference and the references that failed; the requests made are added
+    to ``counter``.
+    """
+    deposits = {}
+    failed = []
+    if not references:
+        return deposits, failed
+
+    max_workers = min(get_client().max_concurrency, len(references))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(get_accounting_data, ref, counter): ref for ref in references}
+        for future in as_completed(futures):
+            ref = futures[future]
+            try:
+                deposits[ref] = extract_deposit(future.result())
+            except Exception:
+                failed.append(ref)
+                logger.exception("Failed to fetch accounting data for deposit %s", ref)
+
+    return deposits, failed
 
-from datetime import datetime
-from .nbb_api import get_references, get_accounting_data
-from .models import Company, AnnualAccount, FinancialRubric, Administrator, Person, Participation
 
-@transaction.atomic
 def import_financials(enterprise_number):
-    AnnualAccount.objects.filter(company__number=enterprise_number).delete()
+    """
+    Import all annual accounts of a company from the NBB.
+
+    Every deposit is downloaded once, concurrently, before anything is written;
+    the writes then happen in a single transaction. Returns a summary with the
+    remote calls this import made, retries and failed attempts included.
+    """
+    calls = Counter()
+
     company = Company.objects.get(number=enterprise_number)
-    references = get_references(enterprise_number)
+    references = get_references(enterprise_number, counter=calls)
 
     incoming_refs = [
         {
@@ -21,8 +78,11 @@ def import_financials(enterprise_number):
 
     incoming_ref_numbers = [ref["reference"] for ref in incoming_refs]
 
+    # The company's own accounts are replaced, so only references filed
+    # under another company count as existing
     existing_refs = set(
         AnnualAccount.objects.filter(reference__in=incoming_ref_numbers)
+        .exclude(company=company)
         .values_list('reference', flat=True)
     )
 
@@ -30,11 +90,39 @@ def import_financials(enterprise_number):
         ref for ref in incoming_refs if ref["reference"] not in existing_refs
     ]
 
+    deposits, failed = fetch_deposits([ref["reference"] for ref in new_accounts_data], counter=calls)
+
+    write_financials(company, new_accounts_data, deposits)
+
+    summary = {
+        "references": len(incoming_refs),
+        "new_accounts": len(new_accounts_data),
+        "failed_deposits": len(failed),
+        "remote_calls": calls['calls'],
+        "remote_errors": calls['errors'],
+    }
+    logger.info("Imported financials for %s: %s", enterprise_number, summary)
+    return summary
+
+
+@transaction.atomic
+def write_financials(company, new_accounts_data, deposits):
+    # "rows": FinancialRubric rows, "packed": AnnualAccount.rubric_values, "both": both
+    storage = settings.FINANCIAL_RUBRIC_STORAGE
+    write_rows = storage in ("rows", "both")
+    write_packed = storage in ("packed", "both")
+
+    AnnualAccount.objects.filter(company=company).delete()
+
     AnnualAccount.objects.bulk_create([
         AnnualAccount(
             company=company,
             reference=ref["reference"],
-            end_fiscal_year=ref["end_date"]
+            end_fiscal_year=ref["end_date"],
+            rubric_values=(
+                AnnualAccount.pack_rubrics(deposits[ref["reference"]]["rubrics"])
+                if write_packed and ref["reference"] in deposits else None
+            ),
         ) for ref in new_accounts_data
     ], batch_size=500)
 
@@ -46,20 +134,11 @@ def import_financials(enterprise_number):
 
     # Cache companies for admin/participations
     referenced_company_ids = set()
-    for ref in new_references:
-        try:
-            data = get_accounting_data(ref)
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                continue
-            else:
-                continue
-        except Exception as e:
-            continue
-        for legal in data.get('Administrators', {}).get('LegalPersons', []):
+    for deposit in deposits.values():
+        for legal in deposit["administrators"].get('LegalPersons', []):
             if id := legal.get('Entity', {}).get('Identifier'):
                 referenced_company_ids.add(id)
-        for part in data.get('ParticipatingInterests', []):
+        for part in deposit["participations"]:
             if id := part.get('Entity', {}).get('Identifier'):
                 referenced_company_ids.add(id)
 
@@ -70,34 +149,24 @@ def import_financials(enterprise_number):
     # Cache for persons to avoid redundant queries
     person_cache = {}
 
-    for ref in new_references:
-        try:
-            accounting_data = get_accounting_data(ref)
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                continue
-            else:
-                continue
-        except Exception as e:
-            continue
-
+    for ref, deposit in deposits.items():
         annual_account = account_lookup[ref]
 
         # FinancialRubrics
-        FinancialRubric.objects.bulk_create([
-            FinancialRubric(
-                code=r.get('Code'),
-                value=r.get('Value'),
-                annual_account=annual_account
-            )
-            for r in accounting_data.get('Rubrics', [])
-            if r.get('Period') == 'N'
-        ], batch_size=200)
+        if write_rows:
+            FinancialRubric.objects.bulk_create([
+                FinancialRubric(
+                    code=code,
+                    value=value,
+                    annual_account=annual_account
+                )
+                for code, value in deposit["rubrics"]
+            ], batch_size=200)
 
         # Administrators
         incoming_admins = []
 
-        for legalEntity in accounting_data.get('Administrators', {}).get('LegalPersons', []):
+        for legalEntity in deposit["administrators"].get('LegalPersons', []):
             reps = legalEntity.get('Representatives')
             company_number = legalEntity.get('Entity', {}).get('Identifier')
             if company_number not in company_cache:
@@ -108,7 +177,7 @@ def import_financials(enterprise_number):
                 "representatives": reps
             })
 
-        for naturalPerson in accounting_data.get('Administrators', {}).get('NaturalPersons', []):
+        for naturalPerson in deposit["administrators"].get('NaturalPersons', []):
             reps = [naturalPerson.get('Person', {})]
             incoming_admins.append({
                 "administering_company": None,
@@ -138,7 +207,7 @@ def import_financials(enterprise_number):
 
         # Participations
         participations = []
-        for part in accounting_data.get('ParticipatingInterests', []):
+        for part in deposit["participations"]:
             company_number = part.get('Entity', {}).get('Identifier')
             held_company = company_cache.get(company_number)
             if not held_company:
@@ -158,5 +227,15 @@ def import_financials(enterprise_number):
 
         Participation.objects.bulk_create(participations, batch_size=200)
 
+    # Read the rubrics back so the KPIs are computed from the stored decimals
+    accounts = AnnualAccount.objects.filter(company=company)
+    if not write_packed:
+        accounts = accounts.prefetch_related(kpi_rubrics_prefetch())
+    accounts = list(accounts)
+    store_kpis(build_kpis(accounts))
+
+    company.latest_account = max(
+        accounts, key=lambda a: (a.end_fiscal_year or date.min, a.pk), default=None
+    )
     company.fin_fetch = datetime.now()
     company.save()
\ No newline at end of file
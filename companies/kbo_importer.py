@@ -2,11 +2,21 @@ import boto3
 import os
 import io
 import csv
+import gzip
+import tempfile
+import zipfile
+from collections import Counter
+from contextlib import ExitStack
 from datetime import datetime
+from functools import partial
+from itertools import islice
 import re
 
 from .utils import parse_enterprise_number
 from .models import Company, Address
+from . import typeahead
+
+BATCH_SIZE = 5000
 
 def remove_parentheses(text):
     if not text:
@@ -21,6 +31,58 @@ def parse_date(date_str):
         except ValueError:
             return datetime.now().date()
 
+def list_s3_keys(s3, bucket_name, prefix):
+    """List every key under a prefix, following list_objects_v2 pagination."""
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            yield obj['Key']
+
+
+def iter_s3_lines(s3, bucket_name, key):
+    """Yield the decoded lines of a (optionally gzipped) S3 object without loading it in memory."""
+    body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+    if key.endswith('.gz'):
+        with gzip.open(body, mode='rt', encoding='utf-8', newline='') as stream:
+            yield from stream
+    else:
+        for line in body.iter_lines(keepends=True):
+            yield line.decode('utf-8')
+
+
+def iter_zip_lines(archive, member):
+    with archive.open(member) as raw:
+        yield from io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def collect_sources(s3, bucket_name, s3_prefix, stack):
+    """
+    Map KBO file names to a callable that yields their lines.
+
+    Plain (or gzipped) CSV objects are streamed straight from S3. Zipped KBO
+    archives are spooled to a temporary file on disk, because zip members can
+    only be read from a seekable file, and their CSV members are streamed from
+    there. ``stack`` owns the temporary files.
+    """
+    sources = {}
+    for key in list_s3_keys(s3, bucket_name, s3_prefix):
+        filename = key.split("/")[-1]
+        if filename.endswith('.zip'):
+            spool = stack.enter_context(tempfile.TemporaryFile())
+            s3.download_fileobj(bucket_name, key, spool)
+            spool.seek(0)
+            archive = stack.enter_context(zipfile.ZipFile(spool))
+            for member in archive.namelist():
+                member_name = member.split("/")[-1]
+                if member_name.endswith('.csv'):
+                    sources[member_name] = partial(iter_zip_lines, archive, member)
+        else:
+            if filename.endswith('.gz'):
+                filename = filename[:-3]
+            sources[filename] = partial(iter_s3_lines, s3, bucket_name, key)
+    return sources
+
+
 def import_kbo_open_data(s3_prefix):
     print(f"Loading KBO data from S3 prefix: {s3_prefix}")
 
@@ -33,16 +95,6 @@ def import_kbo_open_data(s3_prefix):
 
     bucket_name = os.getenv("S3_BUCKET_NAME")
 
-    # List all files under the given prefix
-    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=s3_prefix)
-
-    if 'Contents' not in response:
-        print("No files found.")
-        return
-
-    # Map filenames to their S3 key (full path)
-    available_files = {obj['Key'].split("/")[-1]: obj['Key'] for obj in response['Contents']}
-
     # Define correct processing order
     files_in_order = [
         "enterprise_insert.csv",
@@ -51,99 +103,172 @@ def import_kbo_open_data(s3_prefix):
         "address_insert.csv",
     ]
 
-    for filename in files_in_order:
-        if filename not in available_files:
-            print(f"Skipping {filename} (not found).")
-            continue
+    # Numbers whose name or existence changed, for the typeahead index
+    changed = set()
+    processed = False
+
+    with ExitStack() as stack:
+        available_files = collect_sources(s3, bucket_name, s3_prefix, stack)
+
+        if not available_files:
+            print("No files found.")
+            return
+
+        for filename in files_in_order:
+            if filename not in available_files:
+                print(f"Skipping {filename} (not found).")
+                continue
+
+            print(f"Processing file: {filename}")
+
+            reader = csv.DictReader(available_files[filename]())
+            processed = True
 
-        key = available_files[filename]
-        print(f"Processing file: {filename}")
+            if filename == "enterprise_insert.csv":
+                update_create_companies(reader, changed)
+            elif filename == "enterprise_delete.csv":
+                deactivate_companies(reader)
+            elif filename == "denomination_insert.csv":
+                update_denomination(reader, changed)
+            elif filename == "address_insert.csv":
+                update_create_addresses(reader)
 
-        s3_object = s3.get_object(Bucket=bucket_name, Key=key)
-        file_content = s3_object['Body'].read()
+    if processed:
+        typeahead.publish_changes(changed)
 
-        csv_file = io.StringIO(file_content.decode('utf-8'))
-        reader = csv.DictReader(csv_file)
 
-        if filename == "enterprise_insert.csv":
-            update_create_companies(reader)
-        elif filename == "enterprise_delete.csv":
-            deactivate_companies(reader)
-        elif filename == "denomination_insert.csv":
-            update_denomination(reader)
-        elif filename == "address_insert.csv":
-            update_create_addresses(reader)
+def chunked(iterator, size=BATCH_SIZE):
+    iterator = iter(iterator)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
 
-            
 
-def update_create_companies(reader):
+def update_create_companies(reader, changed=None):
     print("Updating/Creating companies...")
-    for row in reader:
-        if row['TypeOfEnterprise'] != "0" and row['TypeOfEnterprise'] != "2":
-            continue
-        enterprise_number = parse_enterprise_number(row['EnterpriseNumber'])
-        company, created = Company.objects.update_or_create(
-            number=enterprise_number,
-            defaults={
-            'status_code': row['JuridicalSituation'],
-            'enterprise_type_code': row['TypeOfEnterprise'],
-            'start_date': parse_date(row['StartDate']),
-            }
+    counts = Counter()
+    for batch in chunked(reader):
+        # Last row wins when a number appears twice in the same chunk
+        rows = {}
+        for row in batch:
+            if row['TypeOfEnterprise'] != "0" and row['TypeOfEnterprise'] != "2":
+                counts['skipped'] += 1
+                continue
+            enterprise_number = parse_enterprise_number(row['EnterpriseNumber'])
+            rows[enterprise_number] = Company(
+                number=enterprise_number,
+                status_code=row['JuridicalSituation'],
+                enterprise_type_code=row['TypeOfEnterprise'],
+                start_date=parse_date(row['StartDate']),
+            )
+
+        existing = set(
+            Company.objects.filter(number__in=rows.keys()).values_list('number', flat=True)
         )
-        if created:
-            print(f"Created new company: {company.name}")
-        else:
-            print(f"Updated existing company: {company.name}")
-    print("Companies updated/created.")
-    
+        Company.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['number'],
+            update_fields=['status_code', 'enterprise_type_code', 'start_date'],
+        )
+        counts['updated'] += len(existing)
+        counts['created'] += len(rows) - len(existing)
+        if changed is not None:
+            changed.update(rows.keys() - existing)
+    print(f"Companies updated/created: {dict(counts)}")
+    return counts
+
+
 def deactivate_companies(reader):
     print("Deactivating companies...")
-    for row in reader:
-        enterprise_number = parse_enterprise_number(row['EnterpriseNumber'])
-        try:
-            company = Company.objects.get(number=enterprise_number)
-            company.status_code = "0"
-            company.save()
-        except Company.DoesNotExist:
-            print(f"Company with number {enterprise_number} does not exist.")
-    print("Companies deactivated.")
-    
-def update_denomination(reader):
+    counts = Counter()
+    for batch in chunked(reader):
+        numbers = {parse_enterprise_number(row['EnterpriseNumber']) for row in batch}
+        deactivated = Company.objects.filter(number__in=numbers).update(status_code="0")
+        counts['deactivated'] += deactivated
+        counts['missing'] += len(numbers) - deactivated
+    print(f"Companies deactivated: {dict(counts)}")
+    return counts
+
+
+def update_denomination(reader, changed=None):
     print("Updating denominations...")
-    for row in reader:
-        if row['TypeOfDenomination'] != "001":
-            continue
-        enterprise_number = parse_enterprise_number(row['EntityNumber'])
-        try:
-            company = Company.objects.get(number=enterprise_number)
-            company.name = row['Denomination']
-            company.save()
-            print(f"Updated denomination for {company.name}")
-        except Company.DoesNotExist:
-            print(f"Company with number {enterprise_number} does not exist.")
-    print("Denominations updated.")
-    
+    counts = Counter()
+    for batch in chunked(reader):
+        denominations = {}
+        for row in batch:
+            if row['TypeOfDenomination'] != "001":
+                counts['skipped'] += 1
+                continue
+            denominations[parse_enterprise_number(row['EntityNumber'])] = row['Denomination']
+
+        to_update = []
+        companies = Company.objects.filter(number__in=denominations.keys()).only('id', 'number', 'name')
+        for company in companies:
+            name = denominations[company.number]
+            if company.name != name:
+                company.name = name
+                to_update.append(company)
+            else:
+                counts['unchanged'] += 1
+        Company.objects.bulk_update(to_update, ['name'])
+        counts['updated'] += len(to_update)
+        if changed is not None:
+            changed.update(company.number for company in to_update)
+        counts['missing'] += len(denominations) - len(companies)
+    print(f"Denominations updated: {dict(counts)}")
+    return counts
+
+
 def update_create_addresses(reader):
     print("Updating/Creating addresses...")
-    for row in reader:
-        enterprise_number = parse_enterprise_number(row['EntityNumber'])
-        try:
-            company = Company.objects.get(number=enterprise_number)
-        except Company.DoesNotExist:
-            continue
-
-        address, created = Address.objects.update_or_create(
-            company=company,
-            type=row['TypeOfAddress'],   # These are the lookup fields
-            defaults={                   # These fields will be updated or used when creating
+    counts = Counter()
+    fields = ['street', 'house_number', 'postal_code', 'city']
+    for batch in chunked(reader):
+        rows = {}
+        for row in batch:
+            enterprise_number = parse_enterprise_number(row['EntityNumber'])
+            rows[(enterprise_number, row['TypeOfAddress'])] = {
                 'street': remove_parentheses(row['StreetNL']),
                 'house_number': row['HouseNumber'],
                 'postal_code': row['Zipcode'],
                 'city': remove_parentheses(row['MunicipalityNL']),
             }
+
+        company_ids = dict(
+            Company.objects.filter(number__in={number for number, _ in rows})
+            .values_list('number', 'id')
         )
-        if created:
-            print(f"Created new address for {company.name}: {address}")
-        else:
-            print(f"Updated existing address for {company.name}: {address}")
-    print("Addresses updated/created.")
\ No newline at end of file
+        existing = {
+            (address.company_id, address.type): address
+            for address in Address.objects.filter(
+                company_id__in=company_ids.values(),
+                type__in={address_type for _, address_type in rows},
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for (enterprise_number, address_type), values in rows.items():
+            company_id = company_ids.get(enterprise_number)
+            if not company_id:
+                counts['missing'] += 1
+                continue
+            address = existing.get((company_id, address_type))
+            if address is None:
+                to_create.append(Address(company_id=company_id, type=address_type, **values))
+            elif any(getattr(address, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(address, field, value)
+                to_update.append(address)
+            else:
+                counts['unchanged'] += 1
+
+        Address.objects.bulk_create(to_create)
+        Address.objects.bulk_update(to_update, fields)
+        counts['created'] += len(to_create)
+        counts['updated'] += len(to_update)
+    print(f"Addresses updated/created: {dict(counts)}")
+    return counts
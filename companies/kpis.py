@@ -0,0 +1,78 @@
+"""
+Materialized KPIs: one AccountKPI row per annual account.
+
+Rows are written by the financial importer right after an account's rubrics
+and by the ``backfill_kpis`` command for data imported before.
+"""
+from datetime import date
+from itertools import groupby
+
+from .models import AccountKPI, AnnualAccount, kpi_rubrics_prefetch
+
+BATCH_SIZE = 500
+
+
+def build_kpis(accounts):
+    """
+    Return unsaved AccountKPI rows for all accounts of one company.
+
+    The accounts need their rubrics loaded; the previous year used for capex
+    is found among them instead of with a query per account.
+    """
+    kpis = []
+    previous = last = None
+    for account in sorted(accounts, key=lambda a: a.end_fiscal_year or date.min):
+        if account.end_fiscal_year is None:
+            kpis.append(AccountKPI.from_kpis(account, account.calculate_kpis(find_previous=False)))
+            continue
+        # Like get_previous_account: the latest account of a strictly earlier year
+        if last is not None and last.end_fiscal_year < account.end_fiscal_year:
+            previous = last
+        kpis.append(AccountKPI.from_kpis(account, account.calculate_kpis(previous, find_previous=False)))
+        last = account
+    return kpis
+
+
+def store_kpis(kpis):
+    AccountKPI.objects.bulk_create(
+        kpis,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['annual_account'],
+        update_fields=AccountKPI.FIELDS,
+    )
+
+
+def company_kpis(company_ids):
+    """Return unsaved AccountKPI rows for every account of the given companies."""
+    accounts = (
+        AnnualAccount.objects.filter(company_id__in=company_ids)
+        .order_by('company_id')
+        .prefetch_related(kpi_rubrics_prefetch())
+    )
+    kpis = []
+    for _, company_accounts in groupby(accounts, key=lambda a: a.company_id):
+        kpis += build_kpis(company_accounts)
+    return kpis
+
+
+def backfill_kpis(company_ids):
+    """Compute and store the KPIs of every account of the given companies."""
+    kpis = company_kpis(company_ids)
+    store_kpis(kpis)
+    return len(kpis)
+
+
+def calculate_account_kpis(account_ids):
+    """
+    Return {account id: KPIs} computed from the rubrics, without storing them.
+
+    The fallback of ``AnnualAccount.get_kpis`` for many accounts at once; the
+    KPIs are None for accounts without a balance sheet.
+    """
+    company_ids = AnnualAccount.objects.filter(id__in=account_ids).values('company_id')
+    return {
+        kpi.annual_account_id: kpi.as_dict()
+        for kpi in company_kpis(company_ids)
+        if kpi.annual_account_id in account_ids
+    }
@@ -0,0 +1,58 @@
+"""
+Process-wide (code, category) -> name lookup for CodeLabel.
+
+The table is small and only changes when ``load_codes`` runs, so every process
+loads it once and keeps it in memory. ``invalidate_labels`` bumps the
+``code_labels`` DataVersion row; processes compare it at most every
+``VERSION_CHECK_INTERVAL`` seconds and reload when it moved. The version
+lives in the database rather than the cache so it reaches every process
+whatever cache backend is configured (LocMemCache is per process).
+"""
+import threading
+import time
+
+from django.apps import apps
+
+VERSION_CHECK_INTERVAL = 60  # seconds
+
+_labels = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_labels():
+    """Return the {(category, code): name} map, reloading it when it was invalidated."""
+    global _labels, _version, _checked_at
+    now = time.monotonic()
+    if _labels is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+        return _labels
+
+    with _lock:
+        DataVersion = apps.get_model('companies', 'DataVersion')
+        version = DataVersion.current(DataVersion.CODE_LABELS)
+        if _labels is None or version != _version:
+            CodeLabel = apps.get_model('companies', 'CodeLabel')
+            rows = CodeLabel.objects.values_list('category', 'code', 'name')
+            _labels = {(category, code): name for category, code, name in rows}
+            _version = version
+        _checked_at = now
+    return _labels
+
+
+def get_label(code, category, default=None):
+    return get_labels().get((category, code), default)
+
+
+def invalidate_labels():
+    """
+    Drop this process' labels and make every other process reload them.
+
+    Call it in the transaction that changes the labels, so other processes
+    only see the new version once the labels are committed.
+    """
+    global _labels, _checked_at
+    DataVersion = apps.get_model('companies', 'DataVersion')
+    DataVersion.bump(DataVersion.CODE_LABELS)
+    _labels = None
+    _checked_at = 0.0
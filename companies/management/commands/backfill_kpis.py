@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from companies.kpis import backfill_kpis
+from companies.models import AnnualAccount
+
+
+class Command(BaseCommand):
+    help = "Compute the stored KPIs (AccountKPI) of existing annual accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Recompute every account instead of only companies with accounts missing KPIs.",
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help="Companies per batch.")
+
+    def handle(self, *args, **options):
+        accounts = AnnualAccount.objects.all()
+        if not options['all']:
+            accounts = accounts.filter(kpi__isnull=True)
+        # Whole companies are recomputed so capex can see the previous year
+        company_ids = list(accounts.order_by().values_list('company_id', flat=True).distinct())
+
+        total = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(company_ids), batch_size):
+            with transaction.atomic():
+                total += backfill_kpis(company_ids[start:start + batch_size])
+            self.stdout.write(f"  {min(start + batch_size, len(company_ids))}/{len(company_ids)} companies")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored KPIs for {total} annual accounts."))
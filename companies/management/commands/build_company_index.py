@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from companies.typeahead import PrefixIndex, current_version
+
+
+class Command(BaseCommand):
+    help = "Build the company typeahead index and write it to a snapshot file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=settings.COMPANY_TYPEAHEAD_SNAPSHOT,
+            help="Snapshot path (defaults to COMPANY_TYPEAHEAD_SNAPSHOT).",
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        # Record the version first so changes published during the build are replayed
+        index = PrefixIndex.build(version=current_version())
+        index.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} companies into {options['output']} in {time.monotonic() - start:.1f}s."
+        ))
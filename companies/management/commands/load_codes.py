@@ -1,36 +1,57 @@
-import tempfile
+import codecs
+import hashlib
 import requests
 import csv
 from django.core.management.base import BaseCommand
-from companies.models import CodeLabel
+from django.db import transaction
+from companies.labels import invalidate_labels
+from companies.models import CodeLabel, ImportCheckpoint
+
+
+def stream_lines(response, digest, chunk_size=64 * 1024):
+    """Yield the decoded lines of a streamed response, feeding the raw bytes to ``digest``."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        digest.update(chunk)
+        buffer += decoder.decode(chunk)
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
 
 
 class Command(BaseCommand):
     help = 'Load codes into the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Write the codes even when code.csv is unchanged since the last load.",
+        )
+
     def handle(self, *args, **options):
         csv_path = 'https://github.com/desmedtandreas/companions-app-backend/releases/download/company_data/code.csv'
-        
-        self.load_codes(csv_path)
-        
+
+        self.load_codes(csv_path, force=options['force'])
+
         self.stdout.write(self.style.SUCCESS('✅ Successfully loaded all data.'))
 
-    def load_codes(self, csv_url):
+    def load_codes(self, csv_url, force=False):
         try:
-            self.stdout.write(f"📥 Downloading CSV from: {csv_url}")
-            response = requests.get(csv_url)
-            response.raise_for_status()
-
-            with tempfile.NamedTemporaryFile(delete=False, mode='wb') as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
-            self.stdout.write(f"📄 CSV temporarily saved at: {temp_file_path}")
+            self.stdout.write(f"📥 Streaming CSV from: {csv_url}")
+            digest = hashlib.sha256()
+            labels = {}
+            row_count = 0
+            skipped = 0
 
-            with open(temp_file_path, mode='r', encoding='utf-8') as csv_file:
-                reader = csv.DictReader(csv_file)
-                row_count = 0
-                processed = 0
-                skipped = 0
+            with requests.get(csv_url, stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                reader = csv.DictReader(stream_lines(response, digest))
 
                 for row in reader:
                     row_count += 1
@@ -45,22 +66,36 @@ class Command(BaseCommand):
                         continue
 
                     if language == 'NL':
-                        CodeLabel.objects.update_or_create(
-                            code=code,
-                            category=category,
-                            defaults={'name': description}
-                        )
-                        self.stdout.write(self.style.SUCCESS(f"✔ Row {row_count}: {code} → {description}"))
-                        processed += 1
+                        # Last row wins, like the sequential update_or_create did
+                        labels[(code, category)] = description
                     else:
                         skipped += 1
 
-                amount = CodeLabel.objects.count()
-                self.stdout.write(self.style.SUCCESS(f"✅ Processed: {processed} row(s), Skipped: {skipped}"))
-                self.stdout.write(self.style.SUCCESS(f"Total records in CodeLabel: {amount}"))
+            checksum = digest.hexdigest()
+            checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=csv_url)
+            if checkpoint.completed and checkpoint.checksum == checksum and not force:
+                self.stdout.write(f"⏭️ Skipping write: code.csv unchanged since the last load ({checksum[:12]}).")
+                return
+
+            with transaction.atomic():
+                CodeLabel.objects.bulk_create(
+                    [CodeLabel(code=code, category=category, name=name) for (code, category), name in labels.items()],
+                    batch_size=5000,
+                    update_conflicts=True,
+                    unique_fields=['code', 'category'],
+                    update_fields=['name'],
+                )
+                checkpoint.checksum = checksum
+                checkpoint.completed = True
+                checkpoint.save(update_fields=['checksum', 'completed', 'updated_at'])
+                invalidate_labels()
+
+            amount = CodeLabel.objects.count()
+            self.stdout.write(self.style.SUCCESS(f"✅ Processed: {len(labels)} label(s) from {row_count} row(s), Skipped: {skipped}"))
+            self.stdout.write(self.style.SUCCESS(f"Total records in CodeLabel: {amount}"))
         except requests.exceptions.RequestException as e:
             self.stderr.write(self.style.ERROR(f"❌ Error downloading the file: {e}"))
         except csv.Error as e:
             self.stderr.write(self.style.ERROR(f"❌ Error reading the CSV file: {e}"))
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f"❌ Unexpected error: {e}"))
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(f"❌ Unexpected error: {e}"))
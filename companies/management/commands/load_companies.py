@@ -1,37 +1,242 @@
 import csv
+import io
+import multiprocessing
 import requests
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from django.core.management.base import BaseCommand
-from companies.models import Company, Address
+from django.db import connection, connections, transaction
+from companies.models import Company, Address, ImportCheckpoint
+from companies.pg_copy import copy_rows, create_staging_table
+from companies.typeahead import publish_changes
 from companies.utils import parse_enterprise_number
 from itertools import islice
 
 
+def load_address_part(url, use_copy, staging, resume, force):
+    """
+    Load one address file and return its counts and the elapsed time.
+
+    Runs in a worker process with its own database connection. Per-batch
+    progress is not printed, the parent reports each finished file instead.
+    """
+    command = Command(stdout=io.StringIO())
+    command.resume = resume
+    command.force = force
+    started = time.monotonic()
+    if use_copy:
+        counts = command.copy_addresses(url, staging=staging)
+    else:
+        counts = command.load_addresses(url)
+    connections.close_all()
+    return counts, time.monotonic() - started
+
+
 class Command(BaseCommand):
     help = 'Load or update companies, addresses, and legal forms from CSV files.'
 
+    resume = False
+    force = False
+
     ENTERPRISE_URL = 'https://github.com/desmedtandreas/companions-app-backend/releases/download/company_data/enterprise.csv'
     DENOMINATION_URL = 'https://github.com/desmedtandreas/companions-app-backend/releases/download/company_data/denomination.csv'
     ADDRESS_URLS = [
         f'https://github.com/desmedtandreas/companions-app-backend/releases/download/company_data/address_part_{i}.csv' for i in range(1, 7)
     ]
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Load each file with COPY into an unlogged staging table and merge it in one statement (Postgres only).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes that load the address files concurrently.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue unfinished files from their last committed batch.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Reload files even when their ETag matches the last successful load.',
+        )
+
     def handle(self, *args, **options):
-        self.load_companies(self.ENTERPRISE_URL)
-        self.load_denomination(self.DENOMINATION_URL)
-        for url in self.ADDRESS_URLS:
-            self.load_addresses(url)
-        self.update_legal_forms(self.ENTERPRISE_URL)
+        self.resume = options['resume']
+        self.force = options['force']
+        use_copy = options['copy']
+        if use_copy and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ --copy needs Postgres, falling back to batched loading on {connection.vendor}."
+            ))
+            use_copy = False
+
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                "⚠️ SQLite allows a single writer, loading address files in one process."
+            ))
+            workers = 1
+
+        if use_copy:
+            changed = self.copy_companies(self.ENTERPRISE_URL) + self.copy_denomination(self.DENOMINATION_URL)
+        else:
+            changed = self.load_companies(self.ENTERPRISE_URL) + self.load_denomination(self.DENOMINATION_URL)
+        self.load_address_parts(use_copy, workers)
+        if changed:
+            # A full load touches too many companies for a delta: rebuild typeahead indexes
+            publish_changes()
         self.stdout.write(self.style.SUCCESS('✅ Successfully loaded and updated all data.'))
 
-    def stream_csv(self, url, delimiter=';'):
-        with requests.get(url, stream=True) as response:
+    def load_address_parts(self, use_copy, workers):
+        """
+        Load all address files, in ``workers`` processes when more than one.
+
+        The files are independent, so each worker loads whole files with its
+        own database connection. Progress and totals are aggregated here as
+        files finish.
+        """
+        started = time.monotonic()
+        totals = Counter()
+        jobs = [
+            (url, use_copy, f'staging_address_{i}', self.resume, self.force)
+            for i, url in enumerate(self.ADDRESS_URLS, 1)
+        ]
+
+        def report(done, url, counts, elapsed):
+            totals.update(counts)
+            filename = url.rsplit('/', 1)[-1]
+            self.stdout.write(
+                f"[{done}/{len(jobs)}] {filename} loaded in {elapsed:.1f}s "
+                f"(created: {counts['created']}, updated: {counts['updated']}, skipped: {counts['skipped']}). "
+                f"Totals so far: {totals['created']} created, {totals['updated']} updated."
+            )
+
+        if workers > 1:
+            # Forked workers must not share the parent's connection
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {executor.submit(load_address_part, *job): job[0] for job in jobs}
+                for done, future in enumerate(as_completed(futures), 1):
+                    counts, elapsed = future.result()
+                    report(done, futures[future], counts, elapsed)
+        else:
+            for done, (url, _, staging, _, _) in enumerate(jobs, 1):
+                file_started = time.monotonic()
+                if use_copy:
+                    counts = self.copy_addresses(url, staging=staging)
+                else:
+                    counts = self.load_addresses(url)
+                report(done, url, counts, time.monotonic() - file_started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🏠 All address files loaded in {time.monotonic() - started:.1f}s: "
+            f"{totals['created']} created, {totals['updated']} updated, {totals['skipped']} skipped."
+        ))
+
+    def stream_csv(self, url, delimiter=';', state=None):
+        """
+        Stream the rows of a remote CSV file.
+
+        ``state`` tracks the byte offset and row number of the last row handed
+        out, together with the file's ETag and header line. When it holds an
+        offset the download resumes there with an HTTP Range request; if the
+        file changed in the meantime (or ranges are not supported) the server
+        sends the whole file and the state starts over from row 0.
+        """
+        if state is None:
+            state = self.new_state()
+
+        headers = {}
+        if state['byte_offset'] and state['etag'] and state['header']:
+            headers = {'Range': f"bytes={state['byte_offset']}-", 'If-Range': state['etag']}
+
+        with requests.get(url, stream=True, headers=headers) as response:
             response.raise_for_status()
-            lines = (line.decode('utf-8') for line in response.iter_lines())
-            reader = csv.DictReader(lines, delimiter=delimiter)
+            if response.status_code != 206:
+                state.update(self.new_state())
+            state['etag'] = response.headers.get('ETag', '')
+
+            def lines():
+                pending = b''
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    pending += chunk
+                    *complete, pending = pending.split(b'\n')
+                    for line in complete:
+                        state['byte_offset'] += len(line) + 1
+                        yield line.decode('utf-8') + '\n'
+                if pending:
+                    state['byte_offset'] += len(pending)
+                    yield pending.decode('utf-8')
+
+            line_iter = lines()
+            if not state['header']:
+                state['header'] = next(line_iter, '')
+            fieldnames = next(csv.reader([state['header']], delimiter=delimiter), [])
+
+            reader = csv.DictReader(line_iter, fieldnames=fieldnames, delimiter=delimiter)
             for row in reader:
+                state['row_number'] += 1
                 yield row
 
+    def new_state(self):
+        return {'etag': '', 'header': '', 'byte_offset': 0, 'row_number': 0}
+
+    def remote_etag(self, url):
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=30)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return ''
+        return response.headers.get('ETag', '')
+
+    def start_file(self, url):
+        """
+        Decide where loading ``url`` starts.
+
+        Returns None when the file is unchanged since the last successful run
+        (unless --force), the saved position with --resume, or a fresh state.
+        """
+        checkpoint = ImportCheckpoint.objects.filter(source=url).first()
+        if checkpoint is None:
+            return self.new_state()
+
+        etag = self.remote_etag(url)
+        if checkpoint.completed and etag and checkpoint.etag == etag and not self.force:
+            self.stdout.write(f"⏭️ Skipping {url}: unchanged since the last successful load.")
+            return None
+
+        if self.resume and not checkpoint.completed and checkpoint.byte_offset:
+            self.stdout.write(f"↩️ Resuming {url} after row {checkpoint.row_number}.")
+            return {
+                'etag': checkpoint.etag,
+                'header': checkpoint.header,
+                'byte_offset': checkpoint.byte_offset,
+                'row_number': checkpoint.row_number,
+            }
+        return self.new_state()
+
+    def save_checkpoint(self, url, state, completed=False, changed=()):
+        """Save the position in ``url``; ``changed`` are the numbers whose name or existence changed."""
+        ImportCheckpoint.objects.update_or_create(
+            source=url,
+            defaults={**state, 'completed': completed},
+        )
+        # Saved with every committed batch, so stored exports and typeahead indexes see partial loads too
+        publish_changes(changed)
+
+    def finish_file(self, url, state):
+        self.save_checkpoint(url, state, completed=True)
+
     def parse_date(self, date_str):
         if not date_str:
             return None
@@ -40,9 +245,45 @@ class Command(BaseCommand):
         except ValueError:
             return None
 
+    def parse_company_row(self, row):
+        number = parse_enterprise_number(row['EnterpriseNumber'])
+        date_val = self.parse_date(row.get('StartDate', ''))
+        if not number or not date_val:
+            return None
+        return (number, date_val, row.get('JuridicalSituation'), row.get('TypeOfEnterprise'),
+                row.get('JuridicalForm'))
+
+    def parse_denomination_row(self, row):
+        number = parse_enterprise_number(row.get('EntityNumber', ''))
+        denom = row.get('Denomination')
+        if not number or not denom:
+            return None
+        return (number, denom)
+
+    def parse_address_row(self, row):
+        number = parse_enterprise_number(row.get('EntityNumber', ''))
+        addr_type = row.get('TypeOfAddress')
+        if not number or not addr_type:
+            return None
+        return (number, addr_type,
+                row.get('Street'),
+                row.get('HouseNumber'),
+                row.get('Zipcode'),
+                row.get('Municipality'))
+
+    def parsed_rows(self, url, parse, counts, state):
+        for row in self.stream_csv(url, state=state):
+            parsed = parse(row)
+            if parsed is None:
+                counts['skipped'] += 1
+                continue
+            counts['copied'] += 1
+            yield parsed
+
     def load_companies(self, url):
         """
-        Batch-load companies from CSV by chunks to minimize memory and DB hits.
+        Batch-load companies, including their legal form, from CSV by chunks
+        to minimize memory and DB hits. Returns the number of companies created.
         """
 
         created = 0
@@ -58,7 +299,11 @@ class Command(BaseCommand):
                     break
                 yield chunk
 
-        rows_iter = self.stream_csv(url)
+        state = self.start_file(url)
+        if state is None:
+            return 0
+
+        rows_iter = self.stream_csv(url, state=state)
         for batch in chunked(rows_iter, batch_size):
             to_create = []
             to_update = []
@@ -67,27 +312,26 @@ class Command(BaseCommand):
 
             # Parse and filter rows
             for row in batch:
-                number = parse_enterprise_number(row['EnterpriseNumber'])
-                raw_start = row.get('StartDate', '')
-                date_val = self.parse_date(raw_start)
-                if not number or not date_val:
+                parsed = self.parse_company_row(row)
+                if parsed is None:
                     skipped += 1
                     continue
-                numbers.append(number)
-                row_map.append((number, date_val, row.get('JuridicalSituation'), row.get('TypeOfEnterprise')))
+                numbers.append(parsed[0])
+                row_map.append(parsed)
 
             # Fetch existing companies in one query
             existing_qs = Company.objects.filter(number__in=numbers).only(
-                'number', 'start_date', 'status_code', 'enterprise_type_code')
+                'number', 'start_date', 'status_code', 'enterprise_type_code', 'legalform_code')
             existing = {c.number: c for c in existing_qs}
 
             # Prepare create/update lists
-            for number, date_val, status, etype in row_map:
+            for number, date_val, status, etype, legal_form in row_map:
                 if number in existing:
                     comp = existing[number]
                     comp.start_date = date_val
                     comp.status_code = status or comp.status_code
                     comp.enterprise_type_code = etype or comp.enterprise_type_code
+                    comp.legalform_code = legal_form or comp.legalform_code
                     to_update.append(comp)
                     updated += 1
                 else:
@@ -95,32 +339,39 @@ class Command(BaseCommand):
                         number=number,
                         start_date=date_val,
                         status_code=status or '',
-                        enterprise_type_code=etype or ''
+                        enterprise_type_code=etype or '',
+                        legalform_code=legal_form or None
                     ))
                     created += 1
 
-            # Bulk write
-            if to_create:
-                Company.objects.bulk_create(to_create, batch_size=batch_size)
-            if to_update:
-                Company.objects.bulk_update(to_update,
-                    ['start_date', 'status_code', 'enterprise_type_code'],
-                    batch_size=batch_size
-                )
+            # Bulk write, committed together with the checkpoint
+            with transaction.atomic():
+                if to_create:
+                    Company.objects.bulk_create(to_create, batch_size=batch_size)
+                if to_update:
+                    Company.objects.bulk_update(to_update,
+                        ['start_date', 'status_code', 'enterprise_type_code', 'legalform_code'],
+                        batch_size=batch_size
+                    )
+                self.save_checkpoint(url, state, changed=[company.number for company in to_create])
 
             processed_rows += len(batch)
             self.stdout.write(
                 f"Processed {processed_rows} rows so far (created: {created}, updated: {updated}, skipped: {skipped})"
             )
 
+        self.finish_file(url, state)
+
         # Final summary
         self.stdout.write(self.style.SUCCESS(
             f"🏢 Total companies: {created} created, {updated} updated, {skipped} skipped."
         ))
+        return created
 
     def load_denomination(self, url):
         """
         Batch-update company denominations from CSV in chunks for speed.
+        Returns the number of companies renamed.
         """
 
         batch_size = 5000
@@ -136,7 +387,11 @@ class Command(BaseCommand):
                     break
                 yield chunk
 
-        rows_iter = self.stream_csv(url)
+        state = self.start_file(url)
+        if state is None:
+            return 0
+
+        rows_iter = self.stream_csv(url, state=state)
         for batch in chunked(rows_iter, batch_size):
             numbers = []
             row_map = []
@@ -146,13 +401,12 @@ class Command(BaseCommand):
             for row in batch:
                 batch_processed += 1
                 processed_rows += 1
-                number = parse_enterprise_number(row.get('EntityNumber', ''))
-                denom = row.get('Denomination')
-                if not number or not denom:
+                parsed = self.parse_denomination_row(row)
+                if parsed is None:
                     skipped_count += 1
                     continue
-                numbers.append(number)
-                row_map.append((number, denom))
+                numbers.append(parsed[0])
+                row_map.append(parsed)
 
             # Fetch existing companies in bulk
             existing_qs = Company.objects.filter(number__in=numbers).only('number', 'name')
@@ -171,19 +425,24 @@ class Command(BaseCommand):
                 else:
                     skipped_count += 1
 
-            # Bulk-update names
-            if to_update:
-                Company.objects.bulk_update(to_update, ['name'], batch_size=batch_size)
+            # Bulk-update names, committed together with the checkpoint
+            with transaction.atomic():
+                if to_update:
+                    Company.objects.bulk_update(to_update, ['name'], batch_size=batch_size)
+                self.save_checkpoint(url, state, changed=[company.number for company in to_update])
 
             self.stdout.write(
                 f"Processed batch of {batch_processed} denominations (total processed: {processed_rows}). "  \
                 f"Updated: {updated_count}, Skipped: {skipped_count}, Unchanged: {unchanged_count}."
             )
 
+        self.finish_file(url, state)
+
         # Final summary
         self.stdout.write(self.style.SUCCESS(
             f"📝 Total processed: {processed_rows}. {updated_count} updated, {skipped_count} skipped, {unchanged_count} unchanged."
         ))
+        return updated_count
 
     def load_addresses(self, url):
         """
@@ -204,7 +463,11 @@ class Command(BaseCommand):
                     break
                 yield chunk
 
-        rows_iter = self.stream_csv(url)
+        state = self.start_file(url)
+        if state is None:
+            return {'created': 0, 'updated': 0, 'skipped': 0}
+
+        rows_iter = self.stream_csv(url, state=state)
         for batch in chunked(rows_iter, batch_size):
             # Parse batch and collect company numbers and address types
             row_map = []  # list of (company_number, type, street, house_number, postal_code, city)
@@ -214,18 +477,13 @@ class Command(BaseCommand):
             for row in batch:
                 batch_processed += 1
                 processed_rows += 1
-                number = parse_enterprise_number(row.get('EntityNumber', ''))
-                addr_type = row.get('TypeOfAddress')
-                if not number or not addr_type:
+                parsed = self.parse_address_row(row)
+                if parsed is None:
                     skipped_count += 1
                     continue
-                row_map.append((number, addr_type,
-                                row.get('Street'),
-                                row.get('HouseNumber'),
-                                row.get('Zipcode'),
-                                row.get('Municipality')))
-                numbers.add(number)
-                types.add(addr_type)
+                row_map.append(parsed)
+                numbers.add(parsed[0])
+                types.add(parsed[1])
 
             # Map company numbers to IDs
             companies = Company.objects.filter(number__in=numbers).only('id', 'number')
@@ -273,49 +531,183 @@ class Command(BaseCommand):
                     ))
                     created_count += 1
 
-            # Bulk operations
-            if to_create:
-                Address.objects.bulk_create(to_create, batch_size=batch_size)
-            if to_update:
-                Address.objects.bulk_update(
-                    to_update,
-                    ['street', 'house_number', 'postal_code', 'city'],
-                    batch_size=batch_size
-                )
+            # Bulk operations, committed together with the checkpoint
+            with transaction.atomic():
+                if to_create:
+                    Address.objects.bulk_create(to_create, batch_size=batch_size)
+                if to_update:
+                    Address.objects.bulk_update(
+                        to_update,
+                        ['street', 'house_number', 'postal_code', 'city'],
+                        batch_size=batch_size
+                    )
+                self.save_checkpoint(url, state)
 
             self.stdout.write(
                 f"Processed batch of {batch_processed} addresses (total processed: {processed_rows}). "  \
                 f"Created: {created_count}, Updated: {updated_count}, Skipped: {skipped_count}."
             )
 
+        self.finish_file(url, state)
+
         # Final summary
         self.stdout.write(self.style.SUCCESS(
             f"🏠 Total addresses: {created_count} created, {updated_count} updated, {skipped_count} skipped (invalid or missing company)."
         ))
+        return {'created': created_count, 'updated': updated_count, 'skipped': skipped_count}
 
-    def update_legal_forms(self, url):
-        updated_count = 0
-        processed = 0
+    @transaction.atomic
+    def copy_companies(self, url, staging='staging_enterprise'):
+        """
+        COPY enterprise.csv into a staging table and upsert it into companies
+        with a single INSERT ... ON CONFLICT. Returns the number of companies created.
+        """
+        company_table = Company._meta.db_table
+        state = self.start_file(url)
+        if state is None:
+            return 0
+
+        counts = {'copied': 0, 'skipped': 0}
+        columns = {
+            'number': 'varchar(20)',
+            'start_date': 'date',
+            'status_code': 'varchar(255)',
+            'enterprise_type_code': 'varchar(255)',
+            'legalform_code': 'varchar(255)',
+        }
+
+        with connection.cursor() as cursor:
+            create_staging_table(cursor, staging, columns)
+            copy_rows(cursor, staging, columns, self.parsed_rows(url, self.parse_company_row, counts, state))
+            cursor.execute(f"""
+                WITH upserted AS (
+                    INSERT INTO {company_table} AS c
+                        (number, name, start_date, status_code, enterprise_type_code, legalform_code)
+                    SELECT DISTINCT ON (number) number, '', start_date,
+                           COALESCE(status_code, ''), COALESCE(enterprise_type_code, ''),
+                           NULLIF(legalform_code, '')
+                    FROM {staging}
+                    ORDER BY number, line DESC
+                    ON CONFLICT (number) DO UPDATE SET
+                        start_date = EXCLUDED.start_date,
+                        status_code = COALESCE(NULLIF(EXCLUDED.status_code, ''), c.status_code),
+                        enterprise_type_code = COALESCE(NULLIF(EXCLUDED.enterprise_type_code, ''), c.enterprise_type_code),
+                        legalform_code = COALESCE(EXCLUDED.legalform_code, c.legalform_code)
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT count(*), count(*) FILTER (WHERE inserted) FROM upserted
+            """)
+            merged, created = cursor.fetchone()
+            cursor.execute(f'DROP TABLE {staging}')
+        self.finish_file(url, state)
 
-        for row in self.stream_csv(url):
-            number = parse_enterprise_number(row['EnterpriseNumber'])
-            legal_form = row.get('JuridicalForm')
+        self.stdout.write(self.style.SUCCESS(
+            f"🏢 Total companies: {counts['copied']} copied, {merged} upserted, {counts['skipped']} skipped."
+        ))
+        return created
 
-            if not number or not legal_form:
-                continue
+    @transaction.atomic
+    def copy_denomination(self, url, staging='staging_denomination'):
+        """
+        COPY denomination.csv into a staging table and rename the companies
+        whose name changed in a single UPDATE. Returns the number of companies renamed.
+        """
+        company_table = Company._meta.db_table
+        state = self.start_file(url)
+        if state is None:
+            return 0
+
+        counts = {'copied': 0, 'skipped': 0}
+        columns = {
+            'number': 'varchar(20)',
+            'name': 'varchar(255)',
+        }
+
+        with connection.cursor() as cursor:
+            create_staging_table(cursor, staging, columns)
+            copy_rows(cursor, staging, columns, self.parsed_rows(url, self.parse_denomination_row, counts, state))
+            cursor.execute(f"""
+                UPDATE {company_table} AS c SET name = s.name
+                FROM (
+                    SELECT DISTINCT ON (number) number, name
+                    FROM {staging}
+                    ORDER BY number, line DESC
+                ) AS s
+                WHERE c.number = s.number AND c.name IS DISTINCT FROM s.name
+            """)
+            updated = cursor.rowcount
+            cursor.execute(f'DROP TABLE {staging}')
+        self.finish_file(url, state)
 
-            company, created = Company.objects.update_or_create(
-                number=number,
-                defaults={
-                    'legalform_code': legal_form,
-                }
-            )
+        self.stdout.write(self.style.SUCCESS(
+            f"📝 Total processed: {counts['copied']}. {updated} updated, {counts['skipped']} skipped."
+        ))
+        return updated
+
+    @transaction.atomic
+    def copy_addresses(self, url, staging='staging_address'):
+        """
+        COPY an address file into a staging table and merge it into addresses.
 
-            if not created:
-                updated_count += 1
+        Addresses have no unique key on (company, type) to upsert on, so the
+        merge is one UPDATE for changed addresses and one INSERT for new ones.
+        """
+        company_table = Company._meta.db_table
+        address_table = Address._meta.db_table
+        state = self.start_file(url)
+        if state is None:
+            return {'created': 0, 'updated': 0, 'skipped': 0}
+
+        counts = {'copied': 0, 'skipped': 0}
+        columns = {
+            'number': 'varchar(20)',
+            'type': 'varchar(100)',
+            'street': 'varchar(255)',
+            'house_number': 'varchar(20)',
+            'postal_code': 'varchar(20)',
+            'city': 'varchar(100)',
+        }
+        incoming = f"""
+            SELECT c.id AS company_id, s.type,
+                   COALESCE(s.street, '') AS street, COALESCE(s.house_number, '') AS house_number,
+                   COALESCE(s.postal_code, '') AS postal_code, COALESCE(s.city, '') AS city
+            FROM (
+                SELECT DISTINCT ON (number, type) *
+                FROM {staging}
+                ORDER BY number, type, line DESC
+            ) AS s
+            JOIN {company_table} AS c ON c.number = s.number
+        """
 
-            processed += 1
-            if processed % 1000 == 0:
-                self.stdout.write(f'Processed {processed} legal forms...')
+        with connection.cursor() as cursor:
+            create_staging_table(cursor, staging, columns)
+            copy_rows(cursor, staging, columns, self.parsed_rows(url, self.parse_address_row, counts, state))
+            cursor.execute(f"""
+                UPDATE {address_table} AS a SET
+                    street = i.street,
+                    house_number = i.house_number,
+                    postal_code = i.postal_code,
+                    city = i.city
+                FROM ({incoming}) AS i
+                WHERE a.company_id = i.company_id AND a.type = i.type
+                  AND (a.street, a.house_number, a.postal_code, a.city)
+                      IS DISTINCT FROM (i.street, i.house_number, i.postal_code, i.city)
+            """)
+            updated = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO {address_table} (company_id, type, street, house_number, postal_code, city, country)
+                SELECT i.company_id, i.type, i.street, i.house_number, i.postal_code, i.city, ''
+                FROM ({incoming}) AS i
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {address_table} AS a
+                    WHERE a.company_id = i.company_id AND a.type = i.type
+                )
+            """)
+            created = cursor.rowcount
+            cursor.execute(f'DROP TABLE {staging}')
+        self.finish_file(url, state)
 
-        self.stdout.write(self.style.SUCCESS(f'🧩 {updated_count} legal forms updated.'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(
+            f"🏠 Total addresses: {created} created, {updated} updated, {counts['skipped']} skipped."
+        ))
+        return {'created': created, 'updated': updated, 'skipped': counts['skipped']}
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from companies.models import AnnualAccount, FinancialRubric
+
+
+class Command(BaseCommand):
+    help = "Copy FinancialRubric rows into the packed AnnualAccount.rubric_values map"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Annual accounts per batch.")
+        parser.add_argument(
+            '--delete-rows',
+            action='store_true',
+            help="Delete the FinancialRubric rows once packed (for FINANCIAL_RUBRIC_STORAGE=packed).",
+        )
+
+    def handle(self, *args, **options):
+        account_ids = list(
+            AnnualAccount.objects.filter(rubric_values__isnull=True, financial_rubrics__isnull=False)
+            .order_by('pk').values_list('pk', flat=True).distinct()
+        )
+        batch_size = options['batch_size']
+        packed = deleted = 0
+
+        for start in range(0, len(account_ids), batch_size):
+            batch = account_ids[start:start + batch_size]
+            values = defaultdict(list)
+            rubrics = FinancialRubric.objects.filter(annual_account_id__in=batch).order_by('pk')
+            for account_id, code, value in rubrics.values_list('annual_account_id', 'code', 'value'):
+                values[account_id].append((code, value))
+
+            accounts = [
+                AnnualAccount(pk=account_id, rubric_values=AnnualAccount.pack_rubrics(rows))
+                for account_id, rows in values.items()
+            ]
+            with transaction.atomic():
+                AnnualAccount.objects.bulk_update(accounts, ['rubric_values'])
+                if options['delete_rows']:
+                    deleted += rubrics.delete()[0]
+            packed += len(accounts)
+            self.stdout.write(f"  {min(start + batch_size, len(account_ids))}/{len(account_ids)} accounts")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Packed {packed} annual accounts, deleted {deleted} rubric rows."))
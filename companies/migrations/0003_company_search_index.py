@@ -0,0 +1,83 @@
+from django.db import migrations
+
+
+# Built CONCURRENTLY so the companies table stays writable during the build,
+# which is why this migration is not atomic. A failed concurrent build leaves
+# an INVALID index behind that IF NOT EXISTS skips: drop it and migrate again.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Substring and similarity matches on names and numbers
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS company_name_trgm_idx ON companies_company USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS company_number_trgm_idx ON companies_company USING gin (number gin_trgm_ops)",
+    # Prefix matches, read in index order
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS company_name_prefix_idx ON companies_company ((lower(name) COLLATE "C"))',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS company_number_prefix_idx ON companies_company ((number COLLATE "C"))',
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS company_number_prefix_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS company_name_prefix_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS company_number_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS company_name_trgm_idx",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE companies_company_fts USING fts5(
+        name, number, content='companies_company', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER companies_company_fts_ai AFTER INSERT ON companies_company BEGIN
+        INSERT INTO companies_company_fts(rowid, name, number) VALUES (new.id, new.name, new.number);
+    END
+    """,
+    """
+    CREATE TRIGGER companies_company_fts_ad AFTER DELETE ON companies_company BEGIN
+        INSERT INTO companies_company_fts(companies_company_fts, rowid, name, number)
+        VALUES ('delete', old.id, old.name, old.number);
+    END
+    """,
+    """
+    CREATE TRIGGER companies_company_fts_au AFTER UPDATE OF name, number ON companies_company BEGIN
+        INSERT INTO companies_company_fts(companies_company_fts, rowid, name, number)
+        VALUES ('delete', old.id, old.name, old.number);
+        INSERT INTO companies_company_fts(rowid, name, number) VALUES (new.id, new.name, new.number);
+    END
+    """,
+    "INSERT INTO companies_company_fts(companies_company_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS companies_company_fts_au",
+    "DROP TRIGGER IF EXISTS companies_company_fts_ad",
+    "DROP TRIGGER IF EXISTS companies_company_fts_ai",
+    "DROP TABLE IF EXISTS companies_company_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgres,
+            'sqlite': sqlite,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('companies', '0002_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
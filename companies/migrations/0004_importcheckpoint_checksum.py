@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_company_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
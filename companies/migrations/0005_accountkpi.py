@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_importcheckpoint_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountKPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('equity', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('turnover', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('margin', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('ebitda', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('profit', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('remuneration', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('fte', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('real_estate', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('net_debt', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('capex', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('annual_account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='kpi', to='companies.annualaccount')),
+            ],
+        ),
+    ]
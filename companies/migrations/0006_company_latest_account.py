@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def set_latest_accounts(apps, schema_editor):
+    Company = apps.get_model('companies', 'Company')
+    AnnualAccount = apps.get_model('companies', 'AnnualAccount')
+    latest = (
+        AnnualAccount.objects.filter(company=OuterRef('pk'))
+        .order_by(F('end_fiscal_year').desc(nulls_last=True), '-pk')
+        .values('pk')[:1]
+    )
+    Company.objects.filter(annual_accounts__isnull=False).update(latest_account=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_accountkpi'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='latest_account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='companies.annualaccount'),
+        ),
+        migrations.RunPython(set_latest_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0006_company_latest_account'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financialrubric',
+            index=models.Index(fields=['annual_account', 'code'], name='companies_f_annual__66b15d_idx'),
+        ),
+    ]
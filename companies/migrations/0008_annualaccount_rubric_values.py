@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0007_financialrubric_account_code_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annualaccount',
+            name='rubric_values',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0009_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['equity'], name='companies_a_equity_5c26cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['turnover'], name='companies_a_turnove_4666f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['margin'], name='companies_a_margin_3d08b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['ebitda'], name='companies_a_ebitda_bbba5e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['profit'], name='companies_a_profit_f1f1a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['remuneration'], name='companies_a_remuner_8c36f5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['fte'], name='companies_a_fte_6b55df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['real_estate'], name='companies_a_real_es_4ab2bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['net_debt'], name='companies_a_net_deb_23fdc7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountkpi',
+            index=models.Index(fields=['capex'], name='companies_a_capex_fbf368_idx'),
+        ),
+    ]
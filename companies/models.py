@@ -1,9 +1,21 @@
-from django.db import models
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.db.models.functions import Lower
-from datetime import date
+from django.utils.timezone import now
 from taggit.managers import TaggableManager
 from django.utils.functional import cached_property
 
+from .labels import get_label
+
+LEGALFORM_ABBREVIATIONS = {
+    'Besloten Vennootschap': 'BV',
+    'Naamloze Vennootschap': 'NV',
+    'Naamloze vennootschap': 'NV',
+    'Commanditaire Vennootschap': 'CommV',
+}
+
 class CodeLabel(models.Model):
     code = models.CharField(max_length=255)
     name = models.CharField(max_length=255)
@@ -25,6 +37,10 @@ class Company(models.Model):
     website = models.CharField(max_length=255,blank=True, null=True)
     maps_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     fin_fetch = models.DateField(blank=True, null=True)
+    # Newest annual account by end_fiscal_year, maintained by the financial importer
+    latest_account = models.ForeignKey(
+        'AnnualAccount', related_name='+', blank=True, null=True, on_delete=models.SET_NULL
+    )
     tags = TaggableManager(blank=True)
 
     def __str__(self):
@@ -54,52 +70,23 @@ class Company(models.Model):
         
     @property
     def legalform(self):
-        try:
-            return CodeLabel.objects.get(code=self.legalform_code, category="JuridicalForm").name
-        except CodeLabel.DoesNotExist:
-            return None
+        return get_label(self.legalform_code, "JuridicalForm")
         
     def legalform_short(self):
-        abbr = {
-            'Besloten Vennootschap': 'BV',
-            'Naamloze Vennootschap': 'NV',
-            'Naamloze vennootschap': 'NV',
-            'Commanditaire Vennootschap': 'CommV',
-        }
-    
-        try:
-            legalform = self.legalform
-            if legalform in abbr:
-                return abbr[legalform]
-            else:
-                return None
-        except CodeLabel.DoesNotExist:
-            return None
+        return LEGALFORM_ABBREVIATIONS.get(self.legalform)
             
         
     @property
     def enterprise_type(self):
-        try:
-            return CodeLabel.objects.get(code=self.enterprise_type_code, category="TypeOfEnterprise").name
-        except CodeLabel.DoesNotExist:
-            return None
+        return get_label(self.enterprise_type_code, "TypeOfEnterprise")
         
     @cached_property
     def keyfigures(self):
+        # Select `latest_account__kpi` to read this without queries
+        if self.latest_account_id is None:
+            return None
         try:
-            accounts = getattr(self, "_prefetched_objects_cache", {}).get("annual_accounts")
-            if accounts is not None:
-                if not accounts:
-                    return None
-                account = max(
-                    accounts,
-                    key=lambda a: a.end_fiscal_year or date.min,
-                )
-            else:
-                account = self.annual_accounts.order_by("-end_fiscal_year").first()
-            if not account:
-                return None
-            return account.calculate_kpis()
+            return self.latest_account.get_kpis()
         except Exception:
             return None
         
@@ -127,19 +114,59 @@ class Address(models.Model):
     def formatted_address(self):
         return f"{self.street} {self.house_number} {self.postal_code} {self.city}"
     
+# The only rubrics calculate_kpis reads; a filing carries hundreds more
+KPI_RUBRIC_CODES = [
+    "10/15", "70", "9900", "60", "61", "9901", "630", "631/4", "9904",
+    "62", "1003", "22", "54/58", "17", "42", "43", "21/28",
+]
+
+
+def kpi_rubrics_prefetch(lookup="financial_rubrics"):
+    """
+    Prefetch only the rubrics needed for the KPIs of the accounts at ``lookup``.
+
+    They land in ``kpi_rubrics`` rather than the ``financial_rubrics`` cache,
+    so ``financial_rubrics.all()`` still returns every rubric.
+    """
+    return models.Prefetch(
+        lookup, queryset=FinancialRubric.objects.filter(code__in=KPI_RUBRIC_CODES), to_attr="kpi_rubrics"
+    )
+
+
+# Read-only stand-in for a FinancialRubric row when rubrics are stored packed
+PackedRubric = namedtuple("PackedRubric", ["code", "value"])
+
+
 class AnnualAccount(models.Model):
     company = models.ForeignKey(Company, related_name='annual_accounts', on_delete=models.CASCADE)
     reference = models.CharField(max_length=255, unique=True)
     end_fiscal_year = models.DateField(default=None, blank=True, null=True)
+    # Period N rubrics as {code: "value"} when FINANCIAL_RUBRIC_STORAGE packs them
+    rubric_values = models.JSONField(blank=True, null=True)
     
     def __str__(self):
         return self.reference
+
+    @staticmethod
+    def pack_rubrics(rubrics):
+        """Turn (code, value) pairs into the ``rubric_values`` map, rounded like FinancialRubric.value."""
+        return {
+            code: format(Decimal(str(value)).quantize(Decimal("0.01")), "f")
+            for code, value in rubrics
+            if code and value is not None
+        }
     
     @property
     def rubric_map(self):
         # Memoize rubric_map on instance
         if not hasattr(self, '_rubric_map_cache'):
-            rubrics = getattr(self, '_prefetched_objects_cache', {}).get('financial_rubrics')
+            if self.rubric_values is not None:
+                self._rubric_map_cache = {
+                    code: PackedRubric(code, Decimal(value)) for code, value in self.rubric_values.items()
+                }
+                return self._rubric_map_cache
+            # Only the KPI codes when kpi_rubrics_prefetch() was used
+            rubrics = getattr(self, 'kpi_rubrics', None)
             if rubrics is None:
                 rubrics = list(self.financial_rubrics.all())
             self._rubric_map_cache = {rubric.code: rubric for rubric in rubrics}
@@ -152,13 +179,24 @@ class AnnualAccount(models.Model):
         try:
             return self.company.annual_accounts.filter(
                 end_fiscal_year__lt=self.end_fiscal_year
-            ).order_by('-end_fiscal_year').first()
+            ).order_by('-end_fiscal_year').prefetch_related(kpi_rubrics_prefetch()).first()
         except AnnualAccount.DoesNotExist:
             return None
     
-    def calculate_kpis(self):
-        previous = self.get_previous_account()
+    def get_kpis(self):
+        """Return the stored KPIs, computing them when the account has no AccountKPI yet."""
+        try:
+            return self.kpi.as_dict()
+        except AccountKPI.DoesNotExist:
+            return self.calculate_kpis()
+
+    def calculate_kpis(self, previous=None, find_previous=True):
+        """
+        Compute the KPIs from the rubrics, or None without a balance sheet (10/15).
 
+        ``previous`` is the account of the year before; it is looked up when not
+        given unless ``find_previous`` is False.
+        """
         def val(code, account):
             rubric = account.get_rubric(code) if account else None
             return rubric.value if rubric and rubric.value is not None else 0
@@ -171,6 +209,9 @@ class AnnualAccount(models.Model):
         if self.get_rubric("10/15") is None:
             return None
 
+        if previous is None and find_previous:
+            previous = self.get_previous_account()
+
         kpis = {
             "equity": val("10/15", self),
             "turnover": self.get_rubric("70").value if self.get_rubric("70") else None,
@@ -187,11 +228,64 @@ class AnnualAccount(models.Model):
         return kpis
         
     
+class AccountKPI(models.Model):
+    """KPIs of an annual account, computed once when its rubrics are written."""
+    FIELDS = [
+        "equity", "turnover", "margin", "ebitda", "profit",
+        "remuneration", "fte", "real_estate", "net_debt", "capex",
+    ]
+
+    annual_account = models.OneToOneField(AnnualAccount, related_name='kpi', on_delete=models.CASCADE)
+    # All fields are null when the account has no balance sheet (no 10/15 rubric)
+    equity = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    turnover = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    margin = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    ebitda = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    profit = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    remuneration = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    fte = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    real_estate = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    net_debt = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    capex = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+
+    class Meta:
+        # List items are filtered and sorted on these through Company.latest_account
+        indexes = [
+            models.Index(fields=["equity"]),
+            models.Index(fields=["turnover"]),
+            models.Index(fields=["margin"]),
+            models.Index(fields=["ebitda"]),
+            models.Index(fields=["profit"]),
+            models.Index(fields=["remuneration"]),
+            models.Index(fields=["fte"]),
+            models.Index(fields=["real_estate"]),
+            models.Index(fields=["net_debt"]),
+            models.Index(fields=["capex"]),
+        ]
+
+    def __str__(self):
+        return f"KPIs {self.annual_account}"
+
+    @classmethod
+    def from_kpis(cls, annual_account, kpis):
+        return cls(annual_account=annual_account, **(kpis or {}))
+
+    def as_dict(self):
+        if self.equity is None:
+            return None
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
 class FinancialRubric(models.Model):
     code = models.CharField(max_length=255)
     value = models.DecimalField(max_digits=20, decimal_places=2)
     
     annual_account = models.ForeignKey(AnnualAccount, related_name='financial_rubrics', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["annual_account", "code"]),
+        ]
     
     def __str__(self):
         return self.code
@@ -228,4 +322,58 @@ class Participation(models.Model):
     annual_account = models.ForeignKey(AnnualAccount, related_name='participations', on_delete=models.CASCADE)
     
     def __str__(self):
-        return f"{self.held_company.name} ({self.percentage}%)"
\ No newline at end of file
+        return f"{self.held_company.name} ({self.percentage}%)"
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of a bulk file import, saved with every committed batch.
+
+    Lets an interrupted load resume from ``byte_offset`` with an HTTP Range
+    request and lets a finished load be skipped while the file's ETag (or,
+    for loads that read the whole file, its sha256 ``checksum``) is unchanged.
+    """
+    source = models.CharField(max_length=500, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    header = models.TextField(blank=True)
+    byte_offset = models.BigIntegerField(default=0)
+    row_number = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ row {self.row_number}"
+
+
+class DataVersion(models.Model):
+    """
+    A counter bumped whenever a kind of data changes.
+
+    Derived data (stored exports, per-process caches) records the version it
+    was built from and is stale once the counter moves. Lives in the database
+    so every process sees the same value whatever cache backend is configured.
+    Company changes are bumped through ``typeahead.publish_changes``, which
+    also records what changed under the new version.
+    """
+    COMPANIES = 'companies'
+    CODE_LABELS = 'code_labels'
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def bump(cls, name):
+        """Increment the counter and return its new value."""
+        cls.objects.get_or_create(name=name)
+        with transaction.atomic():
+            # The UPDATE locks the row, so the value read back is this bump's
+            cls.objects.filter(name=name).update(version=models.F('version') + 1, updated_at=now())
+            return cls.objects.filter(name=name).values_list('version', flat=True).get()
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
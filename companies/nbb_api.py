@@ -1,54 +1,182 @@
-import requests 
+import logging
+import random
+import threading
+import time
 import uuid
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
 from .utils import parse_enterprise_number
 
+logger = logging.getLogger(__name__)
+
+NBB_BASE_URL = 'https://ws.cbso.nbb.be/authentic'
+NBB_SUBSCRIPTION_KEY = '47b03c68108943a78ad42959e839b1f8'
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class NBBClient:
+    """
+    Keep-alive client for the NBB CBSO API.
+
+    One pooled session is shared by every call, requests time out, and 429/5xx
+    responses and connection errors are retried with jittered exponential
+    backoff. At most ``max_concurrency`` requests are in flight at once and
+    ``rate_limit`` caps the number of requests started per second, so the
+    client can safely be used from a thread pool. Latency per endpoint is
+    collected in ``stats()``; callers that need the calls of one operation
+    pass their own ``counter``.
+    """
+
+    def __init__(self, subscription_key=None, pool_size=10, connect_timeout=5, read_timeout=30,
+                 max_retries=3, backoff_factor=0.5, max_backoff=30, max_concurrency=4, rate_limit=None):
+        self.subscription_key = subscription_key or NBB_SUBSCRIPTION_KEY
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._min_interval = 1.0 / rate_limit if rate_limit else 0
+        self._next_start = 0.0
+        self._rate_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'NBB-CBSO-Subscription-Key': self.subscription_key,
+            'User-Agent': 'curl/7.81.0',
+        })
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, endpoint, path, accept='application/json', counter=None):
+        """
+        GET ``path`` and return the decoded JSON body, or ``{}`` on a 404.
+
+        ``endpoint`` is the name the call's latency is recorded under. Every
+        attempt, retries included, is also added to the ``calls`` (and failed
+        ones to the ``errors``) of ``counter``, a ``collections.Counter``.
+        """
+        url = f'{NBB_BASE_URL}/{path}'
+        attempt = 0
+
+        while True:
+            headers = {
+                'X-Request-Id': str(uuid.uuid4()),
+                'Accept': accept,
+            }
+            try:
+                with self._slots:
+                    self._wait_for_budget()
+                    start = time.monotonic()
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(endpoint, time.monotonic() - start, error=True, counter=counter)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._sleep(attempt)
+                continue
+
+            self._record(endpoint, time.monotonic() - start, error=not response.ok, counter=counter)
 
-def get_references(enterprise_number):
-    
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                attempt += 1
+                self._sleep(attempt, response.headers.get('Retry-After'))
+                continue
+
+            if response.status_code == 404:
+                return {}
+            response.raise_for_status()
+            return response.json()
+
+    def stats(self):
+        """Return a snapshot of the per-endpoint call metrics."""
+        with self._stats_lock:
+            snapshot = {}
+            for endpoint, stat in self._stats.items():
+                snapshot[endpoint] = dict(stat)
+                snapshot[endpoint]['avg_seconds'] = stat['total_seconds'] / stat['calls'] if stat['calls'] else 0
+            return snapshot
+
+    def _record(self, endpoint, elapsed, error=False, counter=None):
+        with self._stats_lock:
+            if counter is not None:
+                counter['calls'] += 1
+                counter['errors'] += int(error)
+            stat = self._stats.setdefault(endpoint, {
+                'calls': 0,
+                'errors': 0,
+                'total_seconds': 0.0,
+                'max_seconds': 0.0,
+            })
+            stat['calls'] += 1
+            stat['errors'] += int(error)
+            stat['total_seconds'] += elapsed
+            stat['max_seconds'] = max(stat['max_seconds'], elapsed)
+        logger.debug("NBB %s call took %.3fs", endpoint, elapsed)
+
+    def _wait_for_budget(self):
+        if not self._min_interval:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + self._min_interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _sleep(self, attempt, retry_after=None):
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1)))
+        # Full jitter keeps parallel workers from retrying in lockstep
+        delay = random.uniform(0, delay)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_backoff, int(retry_after)))
+        logger.warning("NBB request failed, retrying in %.2fs (attempt %d)", delay, attempt)
+        time.sleep(delay)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide NBB client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NBBClient(
+                    subscription_key=settings.NBB_API_KEY,
+                    pool_size=settings.NBB_POOL_SIZE,
+                    connect_timeout=settings.NBB_CONNECT_TIMEOUT,
+                    read_timeout=settings.NBB_READ_TIMEOUT,
+                    max_retries=settings.NBB_MAX_RETRIES,
+                    max_concurrency=settings.NBB_MAX_CONCURRENCY,
+                    rate_limit=settings.NBB_RATE_LIMIT,
+                )
+    return _client
+
+
+def get_references(enterprise_number, counter=None):
     enterprise_number = parse_enterprise_number(enterprise_number)
-    
-    headers = {
-        'NBB-CBSO-Subscription-Key': '47b03c68108943a78ad42959e839b1f8',
-        'X-Request-Id': str(uuid.uuid4()),
-        'Accept': 'application/json',
-        'User-Agent': 'curl/7.81.0'
-    }
-    
-    url = f'https://ws.cbso.nbb.be/authentic/legalEntity/{enterprise_number}/references'
-    
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        if response.status_code == 404:
-            return {}
-        else:
-            raise e
-
-    return data
-    
-    
-def get_accounting_data(reference_number):
-    
-    headers = {
-        'NBB-CBSO-Subscription-Key': '47b03c68108943a78ad42959e839b1f8',
-        'X-Request-Id': str(uuid.uuid4()),
-        'Accept': 'application/x.jsonxbrl',
-        'User-Agent': 'curl/7.81.0'
-    }
-    
-    url = f'https://ws.cbso.nbb.be/authentic/deposit/{reference_number}/accountingData'
-    
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        if response.status_code == 404:
-            return {}
-        else:
-            raise e
-
-    return data
-        
\ No newline at end of file
+    return get_client().get(
+        'references',
+        f'legalEntity/{enterprise_number}/references',
+        counter=counter,
+    )
+
+
+def get_accounting_data(reference_number, counter=None):
+    return get_client().get(
+        'accountingData',
+        f'deposit/{reference_number}/accountingData',
+        accept='application/x.jsonxbrl',
+        counter=counter,
+    )
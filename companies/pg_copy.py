@@ -0,0 +1,72 @@
+"""
+Helpers to stream rows into Postgres with ``COPY FROM STDIN``.
+
+Rows are turned into COPY text format on the fly and read by psycopg2 from a
+file-like wrapper, so a file of any size is loaded with constant memory.
+"""
+import io
+
+
+def copy_escape(value):
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_lines(rows):
+    for row in rows:
+        yield '\t'.join(copy_escape(value) for value in row) + '\n'
+
+
+class IteratorFile(io.TextIOBase):
+    """Minimal read-only file over an iterator of strings."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size is None or size < 0 or length < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def create_staging_table(cursor, table, columns):
+    """
+    (Re)create an empty unlogged staging table.
+
+    ``columns`` maps column names to SQL types. A ``line`` column records the
+    order rows were copied in, so merges can let the last row for a key win.
+    """
+    column_sql = ', '.join(f'{name} {sql_type}' for name, sql_type in columns.items())
+    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    cursor.execute(f'CREATE UNLOGGED TABLE {table} (line bigserial, {column_sql})')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY ``rows`` (tuples in ``columns`` order) into ``table``. Returns the row count."""
+    raw_cursor = cursor.cursor
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    raw_cursor.copy_expert(sql, IteratorFile(copy_lines(rows)))
+    return raw_cursor.rowcount
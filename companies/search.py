@@ -0,0 +1,171 @@
+"""
+Ranked company search for the typeahead.
+
+Matches are ranked: exact enterprise number first, then number prefix, then
+name prefix, then the remaining name and number matches by similarity.
+Postgres is served by COLLATE "C" indexes for prefixes and pg_trgm GIN indexes
+for substrings, SQLite by the companies_company_fts FTS5 trigram table (see
+migration 0003). Queries shorter than three characters only match prefixes.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import Company
+
+SEARCH_LIMIT = 20
+# FTS5 trigram and pg_trgm need at least three characters to use their index
+MIN_TRIGRAM_LENGTH = 3
+# Substring and similarity matches ranked per query on Postgres
+CANDIDATE_LIMIT = 200
+
+
+def normalize_number_query(query):
+    """Return the digits of a query that looks like an enterprise number, else None."""
+    cleaned = re.sub(r'[\s.\-]', '', query.upper())
+    cleaned = re.sub(r'^BE', '', cleaned)
+    return cleaned if cleaned.isdigit() else None
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_company_ids(query, limit=SEARCH_LIMIT):
+    query = re.sub(r"\s+", " ", query).strip()
+    if not query:
+        return []
+
+    number = normalize_number_query(query)
+    if connection.vendor == 'postgresql':
+        return _search_postgres(query.lower(), number, limit)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(query.lower(), number, limit)
+    return _search_fallback(query, number, limit)
+
+
+def search_companies(query, limit=SEARCH_LIMIT):
+    """Return a queryset of the best matches for ``query`` in rank order."""
+    ids = search_company_ids(query, limit)
+    return Company.objects.filter(id__in=ids).order_by(preserve_order(ids))
+
+
+def preserve_order(ids):
+    return Case(
+        *[When(id=pk, then=position) for position, pk in enumerate(ids)],
+        default=len(ids),
+        output_field=IntegerField(),
+    )
+
+
+def _search_postgres(query, number, limit):
+    table = Company._meta.db_table
+    params = {
+        'query': query,
+        'contains': f'%{escape_like(query)}%',
+        'prefix': f'{escape_like(query)}%',
+        'number': number,
+        'number_prefix': f'{number}%' if number else None,
+        'number_contains': f'%{number}%' if number else None,
+        'limit': limit,
+        'candidates': CANDIDATE_LIMIT,
+    }
+    # Prefix matches read straight from the COLLATE "C" indexes, in key order
+    branches = [
+        f"""(SELECT id, 2 AS rank, lower(name) COLLATE "C" AS key FROM {table}
+            WHERE lower(name) COLLATE "C" LIKE %(prefix)s
+            ORDER BY lower(name) COLLATE "C" LIMIT %(limit)s)""",
+    ]
+    if number:
+        branches.append(
+            f"""(SELECT id, 1 AS rank, number COLLATE "C" AS key FROM {table}
+                WHERE number COLLATE "C" LIKE %(number_prefix)s
+                ORDER BY number COLLATE "C" LIMIT %(limit)s)"""
+        )
+
+    # Substring and similar matches through the trigram indexes, bounded
+    # before they are ranked so common terms do not sort every match
+    substring_branches = []
+    if len(query) >= MIN_TRIGRAM_LENGTH:
+        substring_branches.append(
+            f"""(SELECT id, 3, NULL FROM {table}
+                WHERE lower(name) LIKE %(contains)s OR lower(name) %% %(query)s
+                LIMIT %(candidates)s)"""
+        )
+    if number and len(number) >= MIN_TRIGRAM_LENGTH:
+        substring_branches.append(
+            f"""(SELECT id, 3, NULL FROM {table}
+                WHERE number LIKE %(number_contains)s
+                LIMIT %(candidates)s)"""
+        )
+
+    if not substring_branches:
+        # Too short for the trigram indexes: prefix matches only
+        sql = f"""
+            SELECT id FROM ({' UNION ALL '.join(branches)}) AS matches
+            ORDER BY rank, key, id
+            LIMIT %(limit)s
+        """
+    else:
+        branches += substring_branches
+        sql = f"""
+            SELECT c.id FROM {table} AS c
+            WHERE c.id IN (SELECT id FROM ({' UNION ALL '.join(branches)}) AS matches)
+            ORDER BY
+                CASE
+                    WHEN c.number = %(number)s THEN 0
+                    WHEN c.number LIKE %(number_prefix)s THEN 1
+                    WHEN lower(c.name) LIKE %(prefix)s THEN 2
+                    ELSE 3
+                END,
+                similarity(lower(c.name), %(query)s) DESC,
+                c.name
+            LIMIT %(limit)s
+        """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return list(dict.fromkeys(row[0] for row in cursor.fetchall()))
+
+
+def _search_sqlite(query, number, limit):
+    table = Company._meta.db_table
+    rank = """
+        CASE
+            WHEN c.number = %s THEN 0
+            WHEN c.number LIKE %s ESCAPE '\\' THEN 1
+            WHEN lower(c.name) LIKE %s ESCAPE '\\' THEN 2
+            ELSE 3
+        END
+    """
+    rank_params = [number, f'{number}%' if number else None, f'{escape_like(query)}%']
+
+    text = number or query
+    if len(text) >= MIN_TRIGRAM_LENGTH:
+        # A quoted FTS5 phrase over trigram tokens is a substring match
+        phrase = '"' + text.replace('"', '""') + '"'
+        sql = f"""
+            SELECT c.id FROM {table}_fts AS f
+            JOIN {table} AS c ON c.id = f.rowid
+            WHERE {table}_fts MATCH %s
+            ORDER BY {rank}, bm25({table}_fts), c.name
+            LIMIT %s
+        """
+        params = [phrase, *rank_params, limit]
+    else:
+        sql = f"""
+            SELECT c.id FROM {table} AS c
+            WHERE lower(c.name) LIKE %s ESCAPE '\\' OR c.number LIKE %s ESCAPE '\\'
+            ORDER BY {rank}, c.name
+            LIMIT %s
+        """
+        params = [f'{escape_like(query)}%', f'{escape_like(text)}%', *rank_params, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(query, number, limit):
+    qs = Company.objects.filter(Q(name__icontains=query) | Q(number__icontains=number or query))
+    return list(qs.order_by('name').values_list('id', flat=True)[:limit])
@@ -40,7 +40,7 @@ class AnnualAccountSerializer(serializers.ModelSerializer):
         fields = ["reference", "end_fiscal_year", "administrators", "kpis", "participations"]
         
     def get_kpis(self, obj):
-        return obj.calculate_kpis()
+        return obj.get_kpis()
       
         
 class AddressSerializer(serializers.ModelSerializer):
@@ -50,8 +50,12 @@ class AddressSerializer(serializers.ModelSerializer):
         
 
 class CompanySerializer(serializers.ModelSerializer):
+    """
+    Pair with ``CompanySerializer.setup_queryset``: addresses and tags come from
+    prefetches and code labels from the process-wide label cache.
+    """
     addresses = AddressSerializer(many=True, read_only=True)
-    tags = serializers.ListField(child=serializers.CharField(), source='tags.names')
+    tags = serializers.SerializerMethodField()
     
     class Meta:
         model = Company
@@ -67,4 +71,11 @@ class CompanySerializer(serializers.ModelSerializer):
             "fin_fetch", 
             "tags", 
             "addresses"
-        ]
\ No newline at end of file
+        ]
+
+    @staticmethod
+    def setup_queryset(queryset):
+        return queryset.prefetch_related("addresses", "tags")
+
+    def get_tags(self, obj):
+        return [tag.name for tag in obj.tags.all()]
@@ -1,3 +1,384 @@
+import contextlib
+import csv
+import io
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from . import kbo_importer, labels, typeahead
+from .kpis import backfill_kpis, build_kpis, calculate_account_kpis
+from .labels import get_label, invalidate_labels
+from .management.commands.load_companies import Command as LoadCompaniesCommand
+from .models import (
+    AccountKPI, Address, AnnualAccount, CodeLabel, Company, DataVersion, FinancialRubric, ImportCheckpoint,
+    kpi_rubrics_prefetch,
+)
+from .nbb_api import NBBClient
+from .search import search_companies
+from .views import CompanySearchViewSet
+
+
+class CompanySerializerQueryCountTests(TestCase):
+    def setUp(self):
+        CodeLabel.objects.create(code="014", category="JuridicalForm", name="Naamloze Vennootschap")
+        CodeLabel.objects.create(code="2", category="TypeOfEnterprise", name="Rechtspersoon")
+        invalidate_labels()
+
+    def create_companies(self, count, start=0):
+        for i in range(start, start + count):
+            company = Company.objects.create(
+                number=f"{i:010d}",
+                name=f"Company {i}",
+                status_code="000",
+                enterprise_type_code="2",
+                legalform_code="014",
+                start_date=date(2000, 1, 1),
+            )
+            Address.objects.create(company=company, type="REGO", street="Straat", city="Gent", country="België")
+            company.tags.add("client", "prospect")
+
+    def list_companies(self):
+        view = CompanySearchViewSet.as_view({"get": "list"})
+        response = view(APIRequestFactory().get("/api/company-search/"))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # companies + addresses + tags, plus the labels version and the code labels on first use
+        self.create_companies(2)
+        with self.assertNumQueries(5):
+            self.list_companies()
+
+        self.create_companies(12, start=2)
+        with self.assertNumQueries(3):
+            data = self.list_companies()
+
+        self.assertEqual(len(data), 14)
+        company = data[0]
+        self.assertEqual(company["legalform"], "Naamloze Vennootschap")
+        self.assertEqual(company["legalform_short"], "NV")
+        self.assertEqual(company["enterprise_type"], "Rechtspersoon")
+        self.assertEqual(sorted(company["tags"]), ["client", "prospect"])
+        self.assertEqual(len(company["addresses"]), 1)
+
+
+class CodeLabelTests(TestCase):
+    def setUp(self):
+        self.label = CodeLabel.objects.create(code="014", category="JuridicalForm", name="NV")
+        invalidate_labels()
+
+    def test_invalidate_reloads_immediately(self):
+        self.assertEqual(get_label("014", "JuridicalForm"), "NV")
+        self.label.name = "Naamloze Vennootschap"
+        self.label.save()
+        invalidate_labels()
+        self.assertEqual(get_label("014", "JuridicalForm"), "Naamloze Vennootschap")
+
+    def test_reloads_after_version_bump_elsewhere(self):
+        self.assertEqual(get_label("014", "JuridicalForm"), "NV")
+        # Another process changed the labels; this one notices at its next check
+        CodeLabel.objects.filter(pk=self.label.pk).update(name="Naamloze Vennootschap")
+        DataVersion.bump(DataVersion.CODE_LABELS)
+        self.assertEqual(get_label("014", "JuridicalForm"), "NV")
+        labels._checked_at -= labels.VERSION_CHECK_INTERVAL
+        self.assertEqual(get_label("014", "JuridicalForm"), "Naamloze Vennootschap")
+
+
+class CompanySearchTests(TestCase):
+    def create_company(self, number, name):
+        return Company.objects.create(number=number, name=name, start_date=date(2000, 1, 1))
+
+    def search(self, query):
+        return list(search_companies(query).values_list("name", flat=True))
+
+    def test_exact_number_ranks_first(self):
+        self.create_company("0123456789", "Exact")
+        self.create_company("0123456780", "Prefix")
+        self.create_company("9990123456789", "Contains")
+        self.create_company("0555555555", "0123456789 Holding")
+
+        self.assertEqual(self.search("0123456789")[0], "Exact")
+        self.assertEqual(set(self.search("0123456789")), {"Exact", "Contains", "0123456789 Holding"})
+        self.assertEqual(self.search("012345678"), ["Exact", "Prefix", "0123456789 Holding", "Contains"])
+
+    def test_formatted_number_is_normalized(self):
+        self.create_company("0123456789", "Formatted")
+        self.create_company("0987654321", "Other")
+
+        self.assertEqual(self.search("BE 0123.456.789"), ["Formatted"])
+        self.assertEqual(self.search("be0123-456-789"), ["Formatted"])
+
+    def test_name_prefix_ranks_before_substring(self):
+        self.create_company("0000000001", "Bakkerij Janssens")
+        self.create_company("0000000002", "Janssens Bouw")
+
+        self.assertEqual(self.search("janssens"), ["Janssens Bouw", "Bakkerij Janssens"])
+        self.assertEqual(self.search("ja"), ["Janssens Bouw"])
+
+    def test_like_metacharacters_match_literally(self):
+        self.create_company("0000000001", "100% Bio")
+        # Matched by "100%" as a LIKE pattern, but not similar enough for pg_trgm
+        self.create_company("0000000002", "100 Procent Zuivel en Kaas")
+        self.create_company("0000000003", "A_B Consult")
+        self.create_company("0000000004", "AXB Consult")
+
+        self.assertEqual(self.search("100%"), ["100% Bio"])
+        self.assertEqual(self.search("a_"), ["A_B Consult"])
+        self.assertEqual(self.search("a_b"), ["A_B Consult"])
+        self.assertEqual(self.search("%"), [])
+
+
+def kbo_reader(text):
+    return csv.DictReader(io.StringIO(text))
+
+
+class KBOImporterTests(TestCase):
+    def setUp(self):
+        # The importer reports its progress on stdout
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        self.company = Company.objects.create(
+            number="0123456789", name="Oud", status_code="000", enterprise_type_code="2", start_date=date(2000, 1, 1),
+        )
+        Address.objects.create(
+            company=self.company, type="REGO", street="Straat", house_number="1", postal_code="9000", city="Gent",
+        )
+
+    def test_update_create_companies(self):
+        changed = set()
+        counts = kbo_importer.update_create_companies(kbo_reader(
+            "EnterpriseNumber,JuridicalSituation,TypeOfEnterprise,StartDate\n"
+            "0123.456.789,012,2,01/02/2003\n"
+            "0987.654.321,000,2,01/01/2020\n"
+            "0987.654.321,000,2,02/01/2020\n"
+            "0555.555.555,000,1,01/01/2020\n"
+        ), changed)
+
+        self.assertEqual(counts, Counter({"updated": 1, "created": 1, "skipped": 1}))
+        self.assertEqual(changed, {"0987654321"})
+        self.company.refresh_from_db()
+        self.assertEqual((self.company.status_code, self.company.start_date, self.company.name), ("012", date(2003, 2, 1), "Oud"))
+        self.assertEqual(Company.objects.get(number="0987654321").start_date, date(2020, 1, 2))
+        self.assertFalse(Company.objects.filter(number="0555555555").exists())
+
+    def test_deactivate_companies(self):
+        counts = kbo_importer.deactivate_companies(kbo_reader("EnterpriseNumber\n0123.456.789\n0987.654.321\n"))
+        self.assertEqual(counts, Counter({"deactivated": 1, "missing": 1}))
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.status_code, "0")
+
+    def test_update_denomination(self):
+        Company.objects.create(number="0987654321", name="Zelfde", start_date=date(2000, 1, 1))
+        changed = set()
+        counts = kbo_importer.update_denomination(kbo_reader(
+            "EntityNumber,TypeOfDenomination,Denomination\n"
+            "0123.456.789,001,Nieuw\n"
+            "0123.456.789,002,Afkorting\n"
+            "0987.654.321,001,Zelfde\n"
+            "0555.555.555,001,Onbekend\n"
+        ), changed)
+
+        self.assertEqual(counts, Counter({"updated": 1, "unchanged": 1, "skipped": 1, "missing": 1}))
+        self.assertEqual(changed, {"0123456789"})
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.name, "Nieuw")
+
+    def test_update_create_addresses(self):
+        header = "EntityNumber,TypeOfAddress,StreetNL,HouseNumber,Zipcode,MunicipalityNL\n"
+        counts = kbo_importer.update_create_addresses(kbo_reader(
+            header
+            + "0123.456.789,REGO,Laan (Avenue),2,9000,Gent\n"
+            + "0123.456.789,BAET,Straat,1,9000,Gent (Gand)\n"
+            + "0555.555.555,REGO,Straat,1,9000,Gent\n"
+        ))
+        self.assertEqual(counts, Counter({"updated": 1, "created": 1, "missing": 1}))
+        addresses = {a.type: (a.street, a.house_number, a.city) for a in self.company.addresses.all()}
+        self.assertEqual(addresses, {"REGO": ("Laan", "2", "Gent"), "BAET": ("Straat", "1", "Gent")})
+
+        counts = kbo_importer.update_create_addresses(kbo_reader(header + "0123.456.789,REGO,Laan,2,9000,Gent\n"))
+        self.assertEqual(counts, Counter({"unchanged": 1}))
+        self.assertEqual(self.company.addresses.count(), 2)
+
+
+class LoadCompaniesCheckpointTests(TestCase):
+    URL = "https://example.com/enterprise.csv"
+    HEADER = "EnterpriseNumber;JuridicalSituation;TypeOfEnterprise;JuridicalForm;StartDate\n"
+    FIRST = "0123.456.789;000;2;014;01/01/2000\n"
+    SECOND = "0987.654.321;000;2;014;02/02/2002\n"
+
+    def setUp(self):
+        patcher = mock.patch("companies.management.commands.load_companies.requests")
+        self.requests = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.requests.head.return_value.headers = {"ETag": '"v1"'}
+        self.command = LoadCompaniesCommand(stdout=io.StringIO())
+
+    def serve(self, body, status_code=200, etag='"v1"'):
+        response = self.requests.get.return_value.__enter__.return_value
+        response.status_code = status_code
+        response.headers = {"ETag": etag}
+        response.iter_content.return_value = [body.encode()]
+
+    def test_full_load_saves_completed_checkpoint(self):
+        self.serve(self.HEADER + self.FIRST + self.SECOND)
+        self.assertEqual(self.command.load_companies(self.URL), 2)
+
+        checkpoint = ImportCheckpoint.objects.get(source=self.URL)
+        self.assertTrue(checkpoint.completed)
+        self.assertEqual((checkpoint.etag, checkpoint.header, checkpoint.row_number), ('"v1"', self.HEADER, 2))
+        self.assertEqual(checkpoint.byte_offset, len(self.HEADER + self.FIRST + self.SECOND))
+
+    def test_resume_requests_the_remaining_bytes(self):
+        offset = len(self.HEADER + self.FIRST)
+        ImportCheckpoint.objects.create(source=self.URL, etag='"v1"', header=self.HEADER, byte_offset=offset, row_number=1)
+        self.command.resume = True
+        self.serve(self.SECOND, status_code=206)
+
+        self.assertEqual(self.command.load_companies(self.URL), 1)
+        headers = self.requests.get.call_args.kwargs["headers"]
+        self.assertEqual(headers, {"Range": f"bytes={offset}-", "If-Range": '"v1"'})
+        self.assertEqual(list(Company.objects.values_list("number", flat=True)), ["0987654321"])
+        checkpoint = ImportCheckpoint.objects.get(source=self.URL)
+        self.assertTrue(checkpoint.completed)
+        self.assertEqual(checkpoint.row_number, 2)
+
+    def test_resume_starts_over_when_the_file_changed(self):
+        ImportCheckpoint.objects.create(
+            source=self.URL, etag='"v1"', header=self.HEADER, byte_offset=len(self.HEADER + self.FIRST), row_number=1,
+        )
+        self.command.resume = True
+        # If-Range did not match: the server sends the whole new file
+        self.serve(self.HEADER + self.FIRST + self.SECOND, etag='"v2"')
+
+        self.assertEqual(self.command.load_companies(self.URL), 2)
+        checkpoint = ImportCheckpoint.objects.get(source=self.URL)
+        self.assertEqual((checkpoint.etag, checkpoint.row_number), ('"v2"', 2))
+
+    def test_unchanged_file_is_skipped_unless_forced(self):
+        ImportCheckpoint.objects.create(source=self.URL, etag='"v1"', completed=True)
+        self.assertEqual(self.command.load_companies(self.URL), 0)
+        self.requests.get.assert_not_called()
+
+        self.command.force = True
+        self.serve(self.HEADER + self.FIRST)
+        self.assertEqual(self.command.load_companies(self.URL), 1)
+        self.assertEqual(self.requests.get.call_args.kwargs["headers"], {})
+
+
+class KPITests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(number="0123456789", name="Bedrijf", start_date=date(2000, 1, 1))
+        self.accounts = [
+            self.add_account("2021", {"10/15": "100", "70": "1000", "60": "400", "21/28": "50", "630": "5"}),
+            self.add_account("2023", {"10/15": "130", "70": "1200", "9900": "700", "21/28": "80", "630": "10"}),
+            self.add_account("2022", {"10/15": "120", "21/28": "60", "630": "8", "9904": "-3.25"}),
+            # No balance sheet: no KPIs
+            self.add_account("2024", {"70": "1500"}),
+        ]
+
+    def add_account(self, year, rubrics):
+        account = AnnualAccount.objects.create(
+            company=self.company, reference=f"ref-{year}", end_fiscal_year=date(int(year), 12, 31),
+        )
+        FinancialRubric.objects.bulk_create(
+            FinancialRubric(annual_account=account, code=code, value=Decimal(value)) for code, value in rubrics.items()
+        )
+        return account
+
+    def expected_kpis(self):
+        """The KPIs each account computes on its own, looking up its previous year."""
+        return {account.pk: AnnualAccount.objects.get(pk=account.pk).calculate_kpis() for account in self.accounts}
+
+    def test_build_kpis_matches_per_account_calculation(self):
+        accounts = AnnualAccount.objects.filter(company=self.company).prefetch_related(kpi_rubrics_prefetch())
+        kpis = {kpi.annual_account_id: kpi.as_dict() for kpi in build_kpis(accounts)}
+        self.assertEqual(kpis, self.expected_kpis())
+
+        by_year = {account.end_fiscal_year.year: kpis[account.pk] for account in self.accounts}
+        self.assertIsNone(by_year[2021]["capex"])
+        self.assertEqual(by_year[2022]["capex"], Decimal("18"))
+        self.assertEqual(by_year[2023]["capex"], Decimal("30"))
+        self.assertEqual(by_year[2021]["margin"], Decimal("600"))
+        self.assertEqual(by_year[2022]["profit"], Decimal("-3.25"))
+        self.assertIsNone(by_year[2024])
+
+    def test_calculate_account_kpis(self):
+        expected = self.expected_kpis()
+        account_ids = {self.accounts[1].pk, self.accounts[3].pk}
+        self.assertEqual(calculate_account_kpis(account_ids), {pk: expected[pk] for pk in account_ids})
+        self.assertFalse(AccountKPI.objects.exists())
+
+    def test_backfill_kpis(self):
+        self.assertEqual(backfill_kpis([self.company.pk]), 4)
+        stored = {kpi.annual_account_id: kpi.as_dict() for kpi in AccountKPI.objects.all()}
+        self.assertEqual(stored, self.expected_kpis())
+
+        # Upserts on a second run
+        self.assertEqual(backfill_kpis([self.company.pk]), 4)
+        self.assertEqual(AccountKPI.objects.count(), 4)
+
+    def test_backfill_command_only_fills_missing_accounts(self):
+        other = Company.objects.create(number="0987654321", name="Ander", start_date=date(2000, 1, 1))
+        done = AnnualAccount.objects.create(company=other, reference="ref-other", end_fiscal_year=date(2023, 12, 31))
+        AccountKPI.objects.create(annual_account=done, equity=Decimal("1"))
+
+        call_command("backfill_kpis", stdout=io.StringIO())
+        self.assertEqual(AccountKPI.objects.count(), 5)
+        self.assertEqual(AccountKPI.objects.get(annual_account=done).equity, Decimal("1"))
+
+        call_command("backfill_kpis", "--all", stdout=io.StringIO())
+        # Recomputed from its (missing) rubrics
+        self.assertIsNone(AccountKPI.objects.get(annual_account=done).equity)
+
+
+class NBBClientCounterTests(TestCase):
+    def response(self, status_code):
+        response = mock.Mock(status_code=status_code, ok=status_code < 400, headers={})
+        response.json.return_value = {"status": status_code}
+        return response
+
+    def test_counters_only_see_their_own_calls(self):
+        client = NBBClient(subscription_key="key", backoff_factor=0)
+        first, second = Counter(), Counter()
+        with mock.patch.object(client.session, "get", side_effect=[self.response(503), self.response(200), self.response(200)]):
+            self.assertEqual(client.get("references", "a", counter=first), {"status": 200})
+            client.get("references", "b", counter=second)
+
+        self.assertEqual(first, Counter(calls=2, errors=1))
+        self.assertEqual(second, Counter(calls=1, errors=0))
+        self.assertEqual(client.stats()["references"]["calls"], 3)
+
+
+class TypeaheadVersionTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(number="0123456789", name="Oud", start_date=date(2000, 1, 1))
+        self.index = typeahead.PrefixIndex.build(version=typeahead.current_version())
+
+    def test_catch_up_applies_published_changes(self):
+        Company.objects.filter(pk=self.company.pk).update(name="Nieuw")
+        version = typeahead.publish_changes({"0123456789"})
+        self.assertEqual(version, DataVersion.current(DataVersion.COMPANIES))
+
+        index = typeahead._catch_up(self.index, version)
+        self.assertEqual(index.version, version)
+        self.assertEqual(index.search("nieuw"), [self.company.pk])
+        self.assertEqual(index.search("oud"), [])
+
+    def test_missing_delta_or_older_version_needs_a_rebuild(self):
+        version = typeahead.publish_changes(set())
+        self.assertIsNotNone(typeahead._catch_up(self.index, version))
+
+        typeahead.cache.delete(typeahead.CHANGES_KEY.format(version))
+        self.assertIsNone(typeahead._catch_up(self.index, version))
+        # The counter went backwards, e.g. after restoring the database
+        newer = typeahead.PrefixIndex.build(version=version + 5)
+        self.assertIsNone(typeahead._catch_up(newer, version))
 
-# Create your tests here.
+    def test_full_reload_drops_stale_delta(self):
+        typeahead.cache.set(typeahead.CHANGES_KEY.format(self.index.version + 1), ["0123456789"])
+        version = typeahead.publish_changes()
+        self.assertIsNone(typeahead._catch_up(self.index, version))
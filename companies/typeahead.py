@@ -0,0 +1,342 @@
+"""
+In-process prefix index for the company typeahead.
+
+Keeps normalized enterprise numbers and lowercased names as sorted UTF-8 keys
+packed into one buffer per column, with parallel ``array`` offset and id
+columns, so prefix lookups are two binary searches. The index is optional
+(``COMPANY_TYPEAHEAD_INDEX``), built in a background thread the first time a
+worker asks for it, or mapped from the ``COMPANY_TYPEAHEAD_SNAPSHOT`` file so
+all workers share its pages. It is kept fresh incrementally: importers
+publish the changed enterprise numbers, which bumps the ``companies``
+DataVersion and stores the numbers in the shared cache under the new
+version. Every worker polls that version and applies the missing deltas to a
+small overlay that is merged back once it grows. A delta missing from the
+cache (evicted, or a per-process cache) or a version that went backwards
+(a restored database) makes the worker rebuild instead.
+
+An index is never modified once it is published: updates build a new one,
+which replaces the module-level reference in a single assignment, so
+request threads always search a consistent index.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Company, DataVersion
+from .search import normalize_number_query
+
+logger = logging.getLogger(__name__)
+
+CHANGES_KEY = 'company_typeahead:changes:{}'
+CHANGES_TIMEOUT = 7 * 24 * 3600
+VERSION_CHECK_INTERVAL = 30  # seconds
+# Larger deltas are cheaper to apply as a rebuild than through the overlay
+MAX_OVERLAY_SIZE = 50000
+
+# Snapshot layout: header, then per column the offsets and ids (native int64),
+# then the key buffers of both columns
+SNAPSHOT_MAGIC = b'CTYPEAHD'
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_HEADER = struct.Struct('<8sqqqqqq')
+
+
+class PackedKeys:
+    """Sorted byte strings stored back to back in one buffer, with their start offsets."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, keys):
+        data = bytearray()
+        offsets = array('q', [0])
+        for key in keys:
+            data += key
+            offsets.append(len(data))
+        return cls(bytes(data), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+
+def normalize_name(name):
+    return (name or '').lower().encode()
+
+
+class PrefixIndex:
+    def __init__(self, numbers, number_ids, names, name_ids, version=0, overlay=None):
+        self.numbers = numbers
+        self.number_ids = number_ids
+        self.names = names
+        self.name_ids = name_ids
+        self.version = version
+        # Companies changed since the columns were built: id -> (number, name)
+        self.overlay = overlay or {}
+        self.overlay_numbers = sorted((number, pk) for pk, (number, _) in self.overlay.items())
+        self.overlay_names = sorted((name, pk) for pk, (_, name) in self.overlay.items())
+
+    @classmethod
+    def build(cls, version=0):
+        numbers, number_ids = cls.build_column('number', str.encode)
+        names, name_ids = cls.build_column('name', normalize_name)
+        return cls(numbers, number_ids, names, name_ids, version=version)
+
+    @staticmethod
+    def build_column(field, normalize):
+        # One column at a time keeps the unpacked keys of only one in memory
+        entries = [
+            (normalize(value), pk)
+            for pk, value in Company.objects.values_list('id', field).iterator(chunk_size=10000)
+        ]
+        entries.sort()
+        return PackedKeys.pack(key for key, _ in entries), array('q', (pk for _, pk in entries))
+
+    @classmethod
+    def load(cls, path):
+        """Map a snapshot file; its pages are shared by every process that loads it."""
+        with open(path, 'rb') as snapshot:
+            view = memoryview(mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, fmt, version, number_count, number_size, name_count, name_size = (
+            SNAPSHOT_HEADER.unpack_from(view)
+        )
+        if magic != SNAPSHOT_MAGIC or fmt != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported typeahead snapshot format {fmt}")
+
+        position = SNAPSHOT_HEADER.size
+
+        def take(size):
+            nonlocal position
+            section = view[position:position + size]
+            position += size
+            return section
+
+        number_offsets = take(8 * (number_count + 1)).cast('q')
+        number_ids = take(8 * number_count).cast('q')
+        name_offsets = take(8 * (name_count + 1)).cast('q')
+        name_ids = take(8 * name_count).cast('q')
+        numbers = PackedKeys(take(number_size), number_offsets)
+        names = PackedKeys(take(name_size), name_offsets)
+        return cls(numbers, number_ids, names, name_ids, version=version)
+
+    def save(self, path):
+        merged = self.merged()
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, merged.version,
+                len(merged.numbers), len(merged.numbers.data),
+                len(merged.names), len(merged.names.data),
+            ))
+            for section in (
+                merged.numbers.offsets, merged.number_ids, merged.names.offsets, merged.name_ids,
+                merged.numbers.data, merged.names.data,
+            ):
+                snapshot.write(section)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def search(self, query, limit=20):
+        """Return ids of companies whose number, then name, starts with ``query``."""
+        query = ' '.join(query.split()).lower()
+        if not query:
+            return []
+
+        hits = []
+        number = normalize_number_query(query)
+        if number:
+            hits += self._scan(self.numbers, self.number_ids, self.overlay_numbers, number.encode(), limit)
+        if len(hits) < limit:
+            seen = set(hits)
+            for pk in self._scan(self.names, self.name_ids, self.overlay_names, query.encode(), limit):
+                if pk not in seen:
+                    hits.append(pk)
+        return hits[:limit]
+
+    def _scan(self, keys, ids, overlay_keys, prefix, limit):
+        matches = []
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(matches) < limit:
+            key = keys[i]
+            if not key.startswith(prefix):
+                break
+            if ids[i] not in self.overlay:
+                matches.append((key, ids[i]))
+            i += 1
+
+        i = bisect_left(overlay_keys, (prefix,))
+        while i < len(overlay_keys) and overlay_keys[i][0].startswith(prefix):
+            matches.append(overlay_keys[i])
+            i += 1
+
+        matches.sort()
+        return [pk for _, pk in matches[:limit]]
+
+    def with_changes(self, companies, version):
+        """Return a new index with the updated ``(id, number, name)`` rows in its overlay."""
+        overlay = dict(self.overlay)
+        for pk, number, name in companies:
+            overlay[pk] = (number.encode(), normalize_name(name))
+        return PrefixIndex(
+            self.numbers, self.number_ids, self.names, self.name_ids, version=version, overlay=overlay,
+        )
+
+    def merged(self):
+        """Return an index with the overlay folded into the packed columns."""
+        if not self.overlay:
+            return self
+        return PrefixIndex(
+            *self._merge_column(self.numbers, self.number_ids, self.overlay_numbers),
+            *self._merge_column(self.names, self.name_ids, self.overlay_names),
+            version=self.version,
+        )
+
+    def _merge_column(self, keys, ids, overlay_keys):
+        entries = [(keys[i], ids[i]) for i in range(len(keys)) if ids[i] not in self.overlay]
+        entries += overlay_keys
+        entries.sort()
+        return PackedKeys.pack(key for key, _ in entries), array('q', (pk for _, pk in entries))
+
+
+_index = None
+_lock = threading.Lock()
+# Pid of the process running the build; a forked worker does not inherit the thread
+_building_pid = None
+_last_check = 0.0
+
+
+def is_enabled():
+    return getattr(settings, 'COMPANY_TYPEAHEAD_INDEX', False)
+
+
+def current_version():
+    return DataVersion.current(DataVersion.COMPANIES)
+
+
+def publish_changes(numbers=None):
+    """
+    Bump the companies version and tell every worker what changed.
+
+    ``numbers`` are the enterprise numbers whose number or name changed (an
+    empty set when only other fields did); pass None (or a very large set)
+    to make workers rebuild their index.
+    """
+    version = DataVersion.bump(DataVersion.COMPANIES)
+    key = CHANGES_KEY.format(version)
+    if numbers is not None and len(numbers) <= MAX_OVERLAY_SIZE:
+        cache.set(key, list(numbers), timeout=CHANGES_TIMEOUT)
+    else:
+        # Never leave a delta recorded under this version before a reset
+        cache.delete(key)
+    return version
+
+
+def get_index():
+    """
+    Return this process' index, or None while it is disabled or still loading.
+
+    The first call in a process starts the load in a background thread so
+    requests keep falling back to the database in the meantime.
+    """
+    if not is_enabled():
+        return None
+
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _start_build()
+        return None
+
+    _refresh()
+    return _index
+
+
+def is_building():
+    return _building_pid == os.getpid()
+
+
+def _start_build():
+    global _building_pid
+    if not is_building():
+        _building_pid = os.getpid()
+        threading.Thread(target=_load_index, daemon=True).start()
+
+
+def _load_index():
+    global _index, _building_pid
+    try:
+        started = time.monotonic()
+        version = current_version()
+        index = None
+        path = getattr(settings, 'COMPANY_TYPEAHEAD_SNAPSHOT', None)
+        if path and os.path.exists(path):
+            try:
+                index = _catch_up(PrefixIndex.load(path), version)
+            except Exception:
+                logger.exception("Could not load typeahead snapshot %s", path)
+        if index is None:
+            index = PrefixIndex.build(version=version)
+        _index = index
+        logger.info("Company typeahead index ready: %d companies in %.1fs", len(index), time.monotonic() - started)
+    except Exception:
+        logger.exception("Could not build the company typeahead index")
+    finally:
+        _building_pid = None
+        connection.close()
+
+
+def _refresh():
+    global _index, _last_check
+    now = time.monotonic()
+    if now - _last_check < VERSION_CHECK_INTERVAL:
+        return
+    _last_check = now
+
+    version = current_version()
+    if version == _index.version:
+        return
+    with _lock:
+        if version != _index.version and not is_building():
+            index = _catch_up(_index, version)
+            if index is None:
+                # Keep serving the current index while a fresh one is built
+                _start_build()
+            else:
+                _index = index
+
+
+def _catch_up(index, version):
+    """
+    Return ``index`` with the changes published after its version up to ``version``.
+
+    Returns None when a rebuild is needed instead: a full load was published,
+    some of the deltas expired from the cache or the version went backwards.
+    """
+    if version < index.version:
+        return None
+    numbers = set()
+    for missing in range(index.version + 1, version + 1):
+        changed = cache.get(CHANGES_KEY.format(missing))
+        if changed is None:
+            return None
+        numbers.update(changed)
+
+    rows = Company.objects.filter(number__in=numbers).values_list('id', 'number', 'name')
+    index = index.with_changes(rows, version)
+    if len(index.overlay) > MAX_OVERLAY_SIZE:
+        index = index.merged()
+    return index
@@ -1,4 +1,4 @@
-from .models import CodeLabel
+from .labels import get_label
 import re
 
 def parse_enterprise_number_dotted(enterprise_number):
@@ -22,7 +22,4 @@ def parse_enterprise_number(enterprise_number):
     return cleaned
 
 def resolve_label(code, category):
-    try:
-        return CodeLabel.objects.get(code=code, category=category).name
-    except CodeLabel.DoesNotExist:
-        return code
\ No newline at end of file
+    return get_label(code, category, default=code)
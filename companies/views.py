@@ -5,14 +5,15 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 import threading
 import openpyxl
 import os
 import re
 
-from .models import Company
+from .models import Company, kpi_rubrics_prefetch
 from .kbo_importer import import_kbo_open_data
+from .search import SEARCH_LIMIT, preserve_order, search_companies
+from . import typeahead
 from .serializers import CompanySerializer, AnnualAccountSerializer
 from .financial_importer import import_financials
 
@@ -27,16 +28,21 @@ class CompanySearchViewSet(ReadOnlyModelViewSet):
         query = self.request.query_params.get("q", "")
         # Normalize the query
         query = re.sub(r"\s+", " ", query).strip()
-        
-        qs = Company.objects.all()
 
-        if query:
-            qs = qs.filter(
-                Q(name__icontains=query) | Q(number__icontains=query)
-            )
+        if not query:
+            return CompanySerializer.setup_queryset(Company.objects.all())[:SEARCH_LIMIT]
+
+        # Prefix matches from the in-memory index when it is enabled and loaded
+        index = typeahead.get_index()
+        if index is not None:
+            ids = index.search(query, limit=SEARCH_LIMIT)
+            if ids:
+                return CompanySerializer.setup_queryset(
+                    Company.objects.filter(id__in=ids).order_by(preserve_order(ids))
+                )
 
-        # Limit results and sort them by name
-        return qs[:20]
+        # Ranked matches from the search index, already limited
+        return CompanySerializer.setup_queryset(search_companies(query, limit=SEARCH_LIMIT))
     
     @action(detail=False, methods=["post"])
     def bulk(self, request):
@@ -44,7 +50,7 @@ class CompanySearchViewSet(ReadOnlyModelViewSet):
         if not isinstance(numbers, list):
             return Response({"error": "Expected a list of numbers."}, status=400)
 
-        queryset = Company.objects.filter(number__in=numbers)
+        queryset = CompanySerializer.setup_queryset(Company.objects.filter(number__in=numbers))
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
@@ -74,7 +80,7 @@ class CompanySearchViewSet(ReadOnlyModelViewSet):
                     if vat:
                         vat_numbers.append(vat)
 
-            queryset = Company.objects.filter(number__in=vat_numbers)
+            queryset = CompanySerializer.setup_queryset(Company.objects.filter(number__in=vat_numbers))
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
 
@@ -87,7 +93,7 @@ class CompanyViewSet(ReadOnlyModelViewSet):
     lookup_field = "number"
 
     def get_queryset(self):
-        return Company.objects.all()
+        return CompanySerializer.setup_queryset(Company.objects.all())
 
     def get_object(self):
         enterprise_number = self.kwargs.get("number")
@@ -106,7 +112,11 @@ class CompanyViewSet(ReadOnlyModelViewSet):
 
             import_financials(company.number)
 
-        annual_accounts = company.annual_accounts.all().order_by("-end_fiscal_year")[:3]
+        annual_accounts = (
+            company.annual_accounts.select_related("kpi")
+            .prefetch_related(kpi_rubrics_prefetch())
+            .order_by("-end_fiscal_year")[:3]
+        )
         
         serializer = AnnualAccountSerializer(annual_accounts, many=True)
         return Response(serializer.data)
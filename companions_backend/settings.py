@@ -37,11 +37,20 @@ NBB_API_KEY = os.environ.get(
     "NBB_API_KEY",
 )
 
-os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# NBB CBSO client: connection pool size, timeouts (seconds) and retries on 429/5xx
+NBB_POOL_SIZE = int(os.environ.get("NBB_POOL_SIZE", 10))
+NBB_CONNECT_TIMEOUT = float(os.environ.get("NBB_CONNECT_TIMEOUT", 5))
+NBB_READ_TIMEOUT = float(os.environ.get("NBB_READ_TIMEOUT", 30))
+NBB_MAX_RETRIES = int(os.environ.get("NBB_MAX_RETRIES", 3))
+# Concurrent requests per process and requests started per second
+NBB_MAX_CONCURRENCY = int(os.environ.get("NBB_MAX_CONCURRENCY", 4))
+NBB_RATE_LIMIT = float(os.environ.get("NBB_RATE_LIMIT", 10))
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
 # Celery settings
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
@@ -253,12 +262,52 @@ LOGGING = {
     },
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'local-cache',
+# Share the cache between gunicorn workers through the Redis instance that Celery
+# already uses. Without REDIS_URL we fall back to a file cache in development (so
+# Places responses survive restarts) and to a per-process cache otherwise (tests).
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'ssl_cert_reqs': None,
+            } if REDIS_URL.startswith('rediss://') else {},
+        }
     }
-}
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'dev_api_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'local-cache',
+        }
+    }
+
+# How annual account rubrics are stored: "rows" (one FinancialRubric per code),
+# "packed" (one AnnualAccount.rubric_values map per filing) or "both".
+# `manage.py pack_rubrics` converts accounts imported as rows.
+FINANCIAL_RUBRIC_STORAGE = os.environ.get('FINANCIAL_RUBRIC_STORAGE', 'rows')
+
+# Where finished list exports are kept: "local" (LIST_EXPORT_DIR) or "s3"
+# (S3_BUCKET_NAME, under LIST_EXPORT_S3_PREFIX). See lists.exports.
+LIST_EXPORT_STORAGE = os.environ.get('LIST_EXPORT_STORAGE', 'local')
+LIST_EXPORT_DIR = os.environ.get('LIST_EXPORT_DIR', str(BASE_DIR / 'exports'))
+LIST_EXPORT_S3_PREFIX = os.environ.get('LIST_EXPORT_S3_PREFIX', 'list-exports/')
+# Seconds a finished export is kept once a newer export of its list is stored
+LIST_EXPORT_TTL = int(os.environ.get('LIST_EXPORT_TTL', 24 * 3600))
+
+# Optional in-memory prefix index for the company typeahead (see companies.typeahead).
+# Each worker builds it in the background on its first search, or maps the
+# snapshot written by `manage.py build_company_index` when it exists.
+COMPANY_TYPEAHEAD_INDEX = os.environ.get('COMPANY_TYPEAHEAD_INDEX', 'false').lower() == 'true'
+COMPANY_TYPEAHEAD_SNAPSHOT = os.environ.get('COMPANY_TYPEAHEAD_SNAPSHOT', str(BASE_DIR / 'company_typeahead.snapshot'))
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
@@ -0,0 +1,162 @@
+"""
+Asynchronous list exports with stored artifacts.
+
+An export is keyed by the list's contents: the selected enterprise numbers,
+the list's ``updated_at``, the companies' latest financial import and the
+``DataVersion`` counters the company and code label importers bump. A
+finished workbook is stored under that key on local disk or S3 (see
+``LIST_EXPORT_STORAGE``), so exporting an unchanged list again serves the
+stored file. Artifacts older than ``LIST_EXPORT_TTL`` are pruned unless a
+running job still builds them. Jobs are ``ExportJob`` rows, which the API
+and the Celery workers both see.
+"""
+import contextlib
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from companies.models import Company, DataVersion
+from .models import ExportJob
+
+# A job that reported no progress for this long is considered dead
+STALE_AFTER = 3600
+
+
+def export_key(list_instance, numbers, extension='xlsx'):
+    """Return the storage key of an export of ``numbers`` from ``list_instance``."""
+    numbers = sorted(numbers)
+    # Every financial import stamps fin_fetch with the current time
+    fin_fetch = Company.objects.filter(number__in=numbers).aggregate(fin_fetch=Max('fin_fetch'))['fin_fetch']
+    versions = DataVersion.objects.filter(
+        name__in=[DataVersion.COMPANIES, DataVersion.CODE_LABELS]
+    ).order_by('name').values_list('name', 'version')
+    digest = hashlib.sha256()
+    digest.update('\n'.join(numbers).encode())
+    digest.update(f"|{list_instance.updated_at.isoformat()}|{fin_fetch}|{list(versions)}".encode())
+    return f"{list_instance.slug}/{digest.hexdigest()}.{extension}"
+
+
+# Artifact storage
+
+def _s3():
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION"),
+    )
+
+
+def _s3_key(key):
+    return f"{settings.LIST_EXPORT_S3_PREFIX}{key}"
+
+
+def _local_path(key):
+    return os.path.join(settings.LIST_EXPORT_DIR, key)
+
+
+def save_artifact(key, fileobj):
+    if settings.LIST_EXPORT_STORAGE == 's3':
+        _s3().upload_fileobj(fileobj, os.getenv("S3_BUCKET_NAME"), _s3_key(key))
+        return
+    path = _local_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write next to the target and rename, so readers never see a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as out:
+        shutil.copyfileobj(fileobj, out)
+    os.replace(tmp_path, path)
+
+
+def prune_artifacts(list_instance):
+    """
+    Delete the list's stored exports older than ``LIST_EXPORT_TTL``, and its finished jobs.
+
+    Exports that a pending or running job is building are kept whatever
+    their age, as are the partial files of exports still being saved.
+    """
+    cutoff = now() - timedelta(seconds=settings.LIST_EXPORT_TTL)
+    jobs = list_instance.export_jobs.all()
+    active = set(jobs.filter(status__in=ExportJob.ACTIVE).values_list('key', flat=True))
+    jobs.exclude(status__in=ExportJob.ACTIVE).filter(updated_at__lt=cutoff).delete()
+
+    prefix = f"{list_instance.slug}/"
+    if settings.LIST_EXPORT_STORAGE == 's3':
+        s3 = _s3()
+        bucket = os.getenv("S3_BUCKET_NAME")
+        keep = {_s3_key(key) for key in active}
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=_s3_key(prefix)):
+            stale = [
+                {'Key': obj['Key']} for obj in page.get('Contents', [])
+                if obj['Key'] not in keep and obj['LastModified'] < cutoff
+            ]
+            if stale:
+                s3.delete_objects(Bucket=bucket, Delete={'Objects': stale})
+        return
+
+    directory = _local_path(prefix)
+    keep = {_local_path(key) for key in active}
+    with contextlib.suppress(FileNotFoundError):
+        for entry in os.scandir(directory):
+            if entry.path in keep or entry.name.endswith('.tmp'):
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                if datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc) < cutoff:
+                    os.remove(entry.path)
+
+
+def open_artifact(key):
+    """Return a readable file object for a stored artifact, or None when it is gone."""
+    if settings.LIST_EXPORT_STORAGE == 's3':
+        s3 = _s3()
+        try:
+            return s3.get_object(Bucket=os.getenv("S3_BUCKET_NAME"), Key=_s3_key(key))['Body']
+        except s3.exceptions.NoSuchKey:
+            return None
+    try:
+        return open(_local_path(key), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+# Jobs
+
+def get_job(job_id):
+    try:
+        return ExportJob.objects.filter(pk=uuid.UUID(job_id)).first()
+    except ValueError:
+        return None
+
+
+def update_job(job_id, **changes):
+    ExportJob.objects.filter(pk=job_id).update(updated_at=now(), **changes)
+
+
+def start_job(list_instance, key, filename):
+    """
+    Return ``(job, created)`` for an export of ``key``.
+
+    A job that is already pending or running for the same key is reused, so
+    repeated clicks do not build the same workbook twice.
+    """
+    active = ExportJob.objects.filter(key=key, status__in=ExportJob.ACTIVE)
+    active.filter(updated_at__lt=now() - timedelta(seconds=STALE_AFTER)).update(
+        status=ExportJob.FAILED, error='Export stopped reporting progress.', updated_at=now(),
+    )
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(list=list_instance, key=key, filename=filename), True
+    except IntegrityError:
+        # export_job_active_key: another request started this export first
+        job = active.first()
+        if job is None:
+            raise
+        return job, False
@@ -0,0 +1,188 @@
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Lower
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+
+from companies.models import AccountKPI, Address
+from .models import Municipality
+
+
+class ListItemPagination(CursorPagination):
+    """
+    Keyset pagination over a list's items, sorted by ``?sort=``.
+
+    Items are ordered on the raw sort column with NULLs last in either
+    direction and ``id`` as tiebreaker. The cursor position holds both, so
+    positions are unique and the next page is a plain range condition
+    instead of an offset.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    SORT_FIELDS = {
+        'name': 'company__name',
+        'number': 'company__number',
+        'created_at': 'created_at',
+        **{field: f'company__latest_account__kpi__{field}' for field in AccountKPI.FIELDS},
+    }
+    DEFAULT_SORT = '-created_at'
+    # Annotation holding the sort value, read back for the cursor position
+    ordering = ('sort_key', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        sort = request.query_params.get('sort') or self.DEFAULT_SORT
+        self.descending = sort.startswith('-')
+        column = self.SORT_FIELDS.get(sort.lstrip('-'))
+        if column is None:
+            raise ValidationError({'sort': f"Must be one of {', '.join(self.SORT_FIELDS)}, optionally prefixed with '-'."})
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        queryset = queryset.annotate(sort_key=F(column)).order_by(*self.get_order_by(reverse))
+        if current_position is not None:
+            queryset = queryset.filter(self.get_position_filter(current_position, reverse))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+        return self.page
+
+    def get_order_by(self, reverse):
+        # A reversed cursor walks back from its position, so NULLs come first
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        if self.descending == reverse:
+            return (F('sort_key').asc(**nulls), F('id').asc())
+        return (F('sort_key').desc(**nulls), F('id').desc())
+
+    def get_position_filter(self, position, reverse):
+        """Match the items after ``position`` in page order, or before it for a reversed cursor."""
+        value, pk = self.decode_position(position)
+        lookup = 'gt' if self.descending == reverse else 'lt'
+        same_key = Q(sort_key__isnull=True) if value is None else Q(sort_key=value)
+        condition = same_key & Q(**{f'id__{lookup}': pk})
+        if value is not None:
+            condition |= Q(**{f'sort_key__{lookup}': value})
+        # NULLs sort after every value
+        if value is None and reverse:
+            condition |= Q(sort_key__isnull=False)
+        elif value is not None and not reverse:
+            condition |= Q(sort_key__isnull=True)
+        return condition
+
+    def decode_position(self, position):
+        try:
+            value, pk = json.loads(position)
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        value = instance.sort_key
+        return json.dumps([None if value is None else str(value), instance.id])
+
+
+def parse_list(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def parse_decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Must be a number.'})
+    if not number.is_finite():
+        raise ValidationError({name: 'Must be a finite number.'})
+    return number
+
+
+def kpi_ranges(params):
+    """Return {kpi: (min, max)} from the ``<kpi>_min``/``<kpi>_max`` params, validated."""
+    errors = {}
+    for name in params:
+        field, _, bound = name.rpartition('_')
+        if bound in ('min', 'max') and field and field not in AccountKPI.FIELDS:
+            errors[name] = f"Unknown KPI; use one of {', '.join(AccountKPI.FIELDS)}."
+    if errors:
+        raise ValidationError(errors)
+
+    ranges = {}
+    for field in AccountKPI.FIELDS:
+        minimum = parse_decimal(params, f'{field}_min')
+        maximum = parse_decimal(params, f'{field}_max')
+        if minimum is not None and maximum is not None and minimum > maximum:
+            raise ValidationError({f'{field}_min': f'Must not be greater than {field}_max.'})
+        if minimum is not None or maximum is not None:
+            ranges[field] = (minimum, maximum)
+    return ranges
+
+
+def filter_list_items(queryset, params):
+    """
+    Apply the item filters in ``params`` to a ListItem queryset.
+
+    - ``label``: label ids, comma separated; ``none`` matches unlabelled items
+    - ``municipality``: NIS codes, comma separated; matches companies with an
+      address in one of those municipalities
+    - ``<kpi>_min`` / ``<kpi>_max``: bounds on the latest account's stored KPIs
+    """
+    if 'label' in params:
+        labels = parse_list(params['label'])
+        unlabelled = 'none' in labels
+        ids = [label for label in labels if label != 'none']
+        if not all(label.isdigit() for label in ids):
+            raise ValidationError({'label': "Must be label ids or 'none'."})
+        condition = Q(label_id__in=ids)
+        if unlabelled:
+            condition |= Q(label__isnull=True)
+        queryset = queryset.filter(condition)
+
+    if 'municipality' in params:
+        codes = parse_list(params['municipality'])
+        names = [name.lower() for name in Municipality.objects.filter(code__in=codes).values_list('name', flat=True)]
+        addresses = Address.objects.annotate(city_lower=Lower('city')).filter(
+            company_id=OuterRef('company_id'), city_lower__in=names
+        )
+        queryset = queryset.filter(Exists(addresses))
+
+    for field, (minimum, maximum) in kpi_ranges(params).items():
+        if minimum is not None:
+            queryset = queryset.filter(**{f'company__latest_account__kpi__{field}__gte': minimum})
+        if maximum is not None:
+            queryset = queryset.filter(**{f'company__latest_account__kpi__{field}__lte': maximum})
+
+    return queryset
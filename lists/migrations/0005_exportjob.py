@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:52
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0004_alter_list_municipality_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key', models.CharField(db_index=True, max_length=255)),
+                ('filename', models.CharField(max_length=255)),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('processed', models.IntegerField(default=0)),
+                ('total', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='lists.list')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('key',), name='export_job_active_key')],
+            },
+        ),
+    ]
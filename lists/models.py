@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.utils.text import slugify
 
@@ -59,4 +61,41 @@ class Municipality(models.Model):
     code = models.CharField(max_length=5, unique=True)
 
     def __str__(self):
-        return f"{self.name} ({self.nis_code})"
\ No newline at end of file
+        return f"{self.name} ({self.nis_code})"
+
+
+class ExportJob(models.Model):
+    """
+    An asynchronous export of a list, see ``lists.exports``.
+
+    Kept in the database so the API and the Celery workers share it
+    whatever cache backend is configured.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    ACTIVE = [PENDING, RUNNING]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    list = models.ForeignKey(List, related_name='export_jobs', on_delete=models.CASCADE)
+    # Storage key of the artifact, see lists.exports.export_key
+    key = models.CharField(max_length=255, db_index=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, default=PENDING)
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # At most one job builds a given export at a time
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(status__in=['pending', 'running']), name='export_job_active_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
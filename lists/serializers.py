@@ -15,19 +15,11 @@ class CompanySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'number', 'start_date', 'address', 'website', 'keyfigures']
         
     def get_address(self, obj):
-        # Try to use prefetched addresses
-        addresses = getattr(obj, '_prefetched_objects_cache', {}).get('addresses')
-        if addresses is not None:
-            print("Using prefetched addresses!")
-            if addresses:
-                address = addresses[0]
-                return f"{address.street} {address.house_number}, {address.postal_code} {address.city}"
-        else:
-            print("Prefetch missing — falling back to query.")
-            address = obj.addresses.all().first()
-            if address:
-                return f"{address.street} {address.house_number}, {address.postal_code} {address.city}"
-
+        # Index the (prefetched) addresses; .first() would query again
+        addresses = obj.addresses.all()
+        if addresses:
+            address = addresses[0]
+            return f"{address.street} {address.house_number}, {address.postal_code} {address.city}"
         return None
 
 class LabelSerializer(serializers.ModelSerializer):
@@ -56,4 +48,13 @@ class ListSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = List
         fields = ['id', 'name', 'slug', 'description', 'created_at', 'updated_at']
-        read_only_fields = ['slug', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['slug', 'created_at', 'updated_at']
+
+class ListHeaderSerializer(serializers.ModelSerializer):
+    labels = LabelSerializer(many=True, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = List
+        fields = ['id', 'name', 'slug', 'description', 'created_at', 'updated_at', 'labels', 'municipality_scores', 'item_count']
+        read_only_fields = ['slug', 'created_at', 'updated_at']
@@ -0,0 +1,42 @@
+import logging
+
+from celery import shared_task
+from django.db import close_old_connections
+
+from companies.models import Company
+from .exports import prune_artifacts, save_artifact, update_job
+from .models import ExportJob
+from .utils.export_excel import generate_companies_excel
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def export_list_excel_task(job_id, list_id, company_numbers):
+    """Build a list's Excel export and store it under the job's key."""
+    close_old_connections()
+
+    try:
+        job = ExportJob.objects.select_related('list').get(pk=job_id)
+        companies = Company.objects.filter(number__in=company_numbers)
+        total = companies.count()
+        update_job(job_id, status=ExportJob.RUNNING, total=total)
+
+        excel_file = generate_companies_excel(
+            companies,
+            job.list.name,
+            progress=lambda processed: update_job(job_id, processed=processed),
+        )
+        with excel_file:
+            save_artifact(job.key, excel_file)
+
+        update_job(job_id, status=ExportJob.DONE, processed=total)
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        update_job(job_id, status=ExportJob.FAILED, error=str(e))
+        return
+
+    try:
+        prune_artifacts(job.list)
+    except Exception:
+        logger.exception("Could not prune the exports of list %s", job.list.slug)
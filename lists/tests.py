@@ -1 +1,244 @@
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+import openpyxl
+from rest_framework.test import APIRequestFactory
+
+from companies.models import AccountKPI, Address, AnnualAccount, Company
+from .exports import _local_path, prune_artifacts
+from .models import ExportJob, Label, List, ListItem, Municipality
+from .tasks import export_list_excel_task
+from .utils.export_excel import generate_companies_excel
+from .utils.export_frame import companies_frame
+from .views import ListViewSet
+
+
+class ListItemsTestCase(TestCase):
+    def setUp(self):
+        self.list = List.objects.create(name="Prospects")
+
+    def add_company(self, number, name=None, turnover=None, has_kpis=True):
+        company = Company.objects.create(number=number, name=name or f"Company {number}", start_date=date(2000, 1, 1))
+        if has_kpis:
+            account = AnnualAccount.objects.create(company=company, reference=f"ref-{number}", end_fiscal_year=date(2023, 12, 31))
+            AccountKPI.objects.create(annual_account=account, equity=Decimal("1"), turnover=turnover)
+            company.latest_account = account
+            company.save(update_fields=["latest_account"])
+        ListItem.objects.create(list=self.list, company=company)
+        return company
+
+    def get_items(self, params):
+        view = ListViewSet.as_view({"get": "items"})
+        response = view(APIRequestFactory().get(f"/api/{self.list.slug}/items/", params), slug=self.list.slug)
+        return response
+
+    def follow(self, link):
+        params = {key: values[0] for key, values in parse_qs(urlsplit(link).query).items()}
+        response = self.get_items(params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+
+class ListItemSortTests(ListItemsTestCase):
+    def setUp(self):
+        super().setUp()
+        turnovers = ["5", "1", None, "3", "3", None, "8"]
+        for i, turnover in enumerate(turnovers):
+            self.add_company(f"{i:010d}", turnover=turnover and Decimal(turnover))
+        self.add_company("0000000007", has_kpis=False)
+
+    def walk(self, sort):
+        """Return the company numbers of every page, forwards then backwards from the last page."""
+        data = self.follow(f"?sort={sort}&page_size=2")
+        pages = [[item["company"]["number"] for item in data["results"]]]
+        while data["next"]:
+            data = self.follow(data["next"])
+            pages.append([item["company"]["number"] for item in data["results"]])
+
+        backwards = [pages[-1]]
+        while data["previous"]:
+            data = self.follow(data["previous"])
+            backwards.append([item["company"]["number"] for item in data["results"]])
+        self.assertEqual(backwards[::-1], pages)
+        return [number for page in pages for number in page]
+
+    def test_kpi_sort_puts_missing_values_last(self):
+        self.assertEqual(self.walk("turnover"), [
+            "0000000001", "0000000003", "0000000004", "0000000000", "0000000006",
+            "0000000002", "0000000005", "0000000007",
+        ])
+
+    def test_descending_kpi_sort_puts_missing_values_last(self):
+        self.assertEqual(self.walk("-turnover"), [
+            "0000000006", "0000000000", "0000000004", "0000000003", "0000000001",
+            "0000000007", "0000000005", "0000000002",
+        ])
+
+    def test_name_sort(self):
+        self.assertEqual(self.walk("-name"), [f"{i:010d}" for i in reversed(range(8))])
+
+    def test_invalid_sort_and_cursor(self):
+        self.assertEqual(self.get_items({"sort": "rating"}).status_code, 400)
+        self.assertEqual(self.get_items({"cursor": "cD1nYXJiYWdl"}).status_code, 404)
+
+
+class ListItemFilterTests(ListItemsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.label = Label.objects.create(list=self.list, name="Hot")
+        Municipality.objects.create(name="Gent", code="44021")
+        Municipality.objects.create(name="Brugge", code="31005")
+
+        self.gent = self.add_company("0000000001", turnover=Decimal("100"))
+        self.brugge = self.add_company("0000000002", turnover=Decimal("250.50"))
+        self.empty = self.add_company("0000000003", has_kpis=False)
+        Address.objects.create(company=self.gent, type="REGO", street="Straat", city="GENT")
+        Address.objects.create(company=self.brugge, type="REGO", street="Straat", city="Brugge")
+        ListItem.objects.filter(company=self.gent).update(label=self.label)
+
+    def numbers(self, params):
+        response = self.get_items({"sort": "number", **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item["company"]["number"] for item in response.data["results"]]
+
+    def test_label_filter(self):
+        self.assertEqual(self.numbers({"label": str(self.label.pk)}), ["0000000001"])
+        self.assertEqual(self.numbers({"label": "none"}), ["0000000002", "0000000003"])
+        self.assertEqual(self.numbers({"label": f"{self.label.pk}, none"}), ["0000000001", "0000000002", "0000000003"])
+
+    def test_municipality_filter_ignores_case(self):
+        self.assertEqual(self.numbers({"municipality": "44021"}), ["0000000001"])
+        self.assertEqual(self.numbers({"municipality": "44021,31005"}), ["0000000001", "0000000002"])
+        self.assertEqual(self.numbers({"municipality": "99999"}), [])
+
+    def test_kpi_range_filter(self):
+        self.assertEqual(self.numbers({"turnover_min": "100.01"}), ["0000000002"])
+        self.assertEqual(self.numbers({"turnover_min": "100", "turnover_max": "250.50"}), ["0000000001", "0000000002"])
+        self.assertEqual(self.numbers({"turnover_max": "99", "sort": "-turnover"}), [])
+
+    def test_invalid_filters(self):
+        for params, field in [
+            ({"label": "hot"}, "label"),
+            ({"turnover_min": "abc"}, "turnover_min"),
+            ({"turnover_max": "NaN"}, "turnover_max"),
+            ({"rating_min": "1"}, "rating_min"),
+            ({"turnover_min": "5", "turnover_max": "1"}, "turnover_min"),
+        ]:
+            with self.subTest(params=params):
+                response = self.get_items(params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data)
+
+
+class ListHeaderTests(ListItemsTestCase):
+    def get_header(self, slug):
+        view = ListViewSet.as_view({"get": "header"})
+        return view(APIRequestFactory().get(f"/api/{slug}/header/"), slug=slug)
+
+    def test_header(self):
+        Label.objects.create(list=self.list, name="Hot")
+        for number in ["0000000001", "0000000002"]:
+            self.add_company(number)
+
+        with self.assertNumQueries(2):
+            response = self.get_header(self.list.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["item_count"], 2)
+        self.assertEqual([label["name"] for label in response.data["labels"]], ["Hot"])
+        self.assertNotIn("items", response.data)
+
+    def test_unknown_list(self):
+        self.assertEqual(self.get_header("missing").status_code, 404)
+
+
+class ListExportTests(ListItemsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_company("0000000001")
+        self.add_company("0000000002")
+        export_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(LIST_EXPORT_DIR=export_dir, LIST_EXPORT_STORAGE='local'))
+        # Run the export task in the request, as CELERY_TASK_ALWAYS_EAGER would, on the
+        # test's connection: a worker's close_old_connections would end its transaction
+        self.enterContext(mock.patch.object(export_list_excel_task, 'delay', side_effect=export_list_excel_task))
+        self.enterContext(mock.patch('lists.tasks.close_old_connections'))
+        # Closing a FileResponse finishes the request; keep the connection like the test Client does
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def export(self, numbers):
+        view = ListViewSet.as_view({"post": "export_excel"})
+        request = APIRequestFactory().post(f"/api/{self.list.slug}/export-excel/", {"companies": numbers}, format="json")
+        return view(request, slug=self.list.slug)
+
+    def download(self, job_id):
+        view = ListViewSet.as_view({"get": "export_job"})
+        request = APIRequestFactory().get(f"/api/{self.list.slug}/export-jobs/{job_id}/", {"download": "true"})
+        return view(request, slug=self.list.slug, job_id=job_id)
+
+    def test_jobs_of_one_list_keep_their_files(self):
+        first = self.export(["0000000001"])
+        second = self.export(["0000000002"])
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(ExportJob.objects.filter(status=ExportJob.DONE).count(), 2)
+
+        for response in (first, second):
+            download = self.download(response.data["job_id"])
+            self.assertEqual(download.status_code, 200)
+            download.close()
+
+        # The same selection again is served from storage
+        again = self.export(["0000000001"])
+        self.assertEqual(again.status_code, 200)
+        again.close()
+
+    def test_expired_file(self):
+        job_id = self.export(["0000000001"]).data["job_id"]
+        os.remove(_local_path(ExportJob.objects.get().key))
+
+        self.assertEqual(self.download(job_id).status_code, 404)
+        # Exporting again builds a new file
+        response = self.export(["0000000001"])
+        self.assertEqual(response.status_code, 202)
+        download = self.download(response.data["job_id"])
+        self.assertEqual(download.status_code, 200)
+        download.close()
+
+    def test_prune_removes_expired_exports(self):
+        self.export(["0000000001"])
+        old = ExportJob.objects.get()
+        ExportJob.objects.filter(pk=old.pk).update(updated_at=old.updated_at.replace(year=2000))
+        os.utime(_local_path(old.key), (0, 0))
+        running = ExportJob.objects.create(list=self.list, key=f"{self.list.slug}/running.xlsx", filename="x.xlsx")
+        with open(_local_path(running.key), "wb") as artifact:
+            artifact.write(b"partial")
+        os.utime(_local_path(running.key), (0, 0))
+        self.export(["0000000002"])
+
+        prune_artifacts(self.list)
+        self.assertFalse(os.path.exists(_local_path(old.key)))
+        self.assertFalse(ExportJob.objects.filter(pk=old.pk).exists())
+        self.assertTrue(os.path.exists(_local_path(running.key)))
+        self.assertEqual(len(os.listdir(os.path.dirname(_local_path(old.key)))), 2)
+
+
+class ExportOrderTests(ListItemsTestCase):
+    def test_excel_and_frame_list_companies_in_the_same_order(self):
+        for number, name in [("0000000003", "Bakkerij"), ("0000000001", "Zuivel"), ("0000000002", "Bakkerij")]:
+            self.add_company(number, name=name, has_kpis=False)
+        companies = Company.objects.all()
+
+        with generate_companies_excel(companies, "Prospects") as workbook:
+            rows = list(openpyxl.load_workbook(workbook).active.iter_rows(min_row=2, values_only=True))
+        excel_numbers = [row[1] for row in rows]
+
+        # By name, then by id for equal names
+        self.assertEqual(excel_numbers, ["0000000003", "0000000002", "0000000001"])
+        self.assertEqual(excel_numbers, list(companies_frame(companies)["Ondernemingsnummer"]))
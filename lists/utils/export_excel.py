@@ -1,76 +1,111 @@
+import pickle
+import tempfile
+
 import openpyxl
 from openpyxl.utils import get_column_letter
-from io import BytesIO
-from companies.models import Company
 
+CHUNK_SIZE = 2000
+
+HEADERS = [
+    'Bedrijfsnaam',
+    'Ondernemingsnummer',
+    'Adres',
+    'Oprichting',
+    'Website',
+    'Juridische Vorm',
+    'Eigen Vermogen',
+    'Omzet',
+    'Brutomarge',
+    'EBITDA',
+    'Winst/Verlies',
+    'Netto Schuldpositie',
+    'Capex Noden',
+    'Bezoldigingen',
+    'FTE',
+    'Vastgoed'
+]
+
+KPI_COLUMNS = [
+    'equity', 'turnover', 'margin', 'ebitda', 'profit',
+    'net_debt', 'capex', 'remuneration', 'fte', 'real_estate',
+]
+
+
+def order_for_export(companies):
+    """Order companies the way every export format lists them."""
+    return companies.order_by("name", "pk")
+
+
+def export_queryset(companies):
+    """Load what company_row reads: the stored KPIs and addresses, without the packed rubrics."""
+    return (
+        order_for_export(companies)
+        .select_related("latest_account__kpi")
+        .defer("latest_account__rubric_values")
+        .prefetch_related("addresses")
+    )
+
+
+def format_address(company):
+    # Read the prefetched addresses; .first() would query again
+    addresses = company.addresses.all()
+    if not addresses:
+        return ''
+    address = addresses[0]
+    return f"{address.street} {address.house_number}, {address.postal_code} {address.city}"
 
-def generate_companies_excel(companies, listname):
-    """Generate an Excel file with company information."""
+
+def company_row(company):
+    keyfigures = company.keyfigures or {}
+    return [
+        company.name,
+        company.number,
+        format_address(company),
+        company.start_date,
+        company.website,
+        company.legalform,
+    ] + [keyfigures.get(column, '') for column in KPI_COLUMNS]
+
+
+def generate_companies_excel(companies, listname, progress=None):
+    """
+    Generate an Excel file with company information.
+
+    Companies are read once in chunks; rows are spooled to disk while the
+    column widths are measured, then streamed into a write-only workbook
+    (which needs the widths before its first row). ``progress`` is called
+    with the number of rows read after every chunk. Returns an open temporary
+    file positioned at the start.
+    """
     if hasattr(companies, "prefetch_related"):
-        companies = companies.prefetch_related("addresses")
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = listname
-
-    headers = [
-        'Bedrijfsnaam',
-        'Ondernemingsnummer',
-        'Adres',
-        'Oprichting',
-        'Website',
-        'Juridische Vorm',
-        'Eigen Vermogen',
-        'Omzet',
-        'Brutomarge',
-        'EBITDA',
-        'Winst/Verlies',
-        'Netto Schuldpositie',
-        'Capex Noden',
-        'Bezoldigingen',
-        'FTE',
-        'Vastgoed'
-    ]
-    ws.append(headers)
-
-    for company in companies:
-        address = company.addresses.first()
-        address_str = (
-            f"{address.street} {address.house_number}, {address.postal_code} {address.city}"
-            if address else ''
-        )
-
-        keyfigures = company.keyfigures or {}
-
-        row = [
-            company.name,
-            company.number,
-            address_str,
-            company.start_date,
-            company.website,
-            company.legalform,
-            keyfigures.get('equity', ''),
-            keyfigures.get('turnover', ''),
-            keyfigures.get('margin', ''),
-            keyfigures.get('ebitda', ''),
-            keyfigures.get('profit', ''),
-            keyfigures.get('net_debt', ''),
-            keyfigures.get('capex', ''),
-            keyfigures.get('remuneration', ''),
-            keyfigures.get('fte', ''),
-            keyfigures.get('real_estate', '')
-        ]
-        ws.append(row)
-
-    for col in ws.columns:
-        max_length = 0
-        column = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[column].width = max_length + 2
-
-    output = BytesIO()
-    wb.save(output)
+        companies = export_queryset(companies).iterator(chunk_size=CHUNK_SIZE)
+
+    widths = [len(header) for header in HEADERS]
+    with tempfile.TemporaryFile() as spool:
+        for count, company in enumerate(companies, start=1):
+            if progress and count % CHUNK_SIZE == 0:
+                progress(count)
+            row = company_row(company)
+            for i, value in enumerate(row):
+                if value:
+                    widths[i] = max(widths[i], len(str(value)))
+            pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=listname)
+        for i, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = width + 2
+
+        ws.append(HEADERS)
+        spool.seek(0)
+        while True:
+            try:
+                ws.append(pickle.load(spool))
+            except EOFError:
+                break
+
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+
     output.seek(0)
     return output
@@ -0,0 +1,64 @@
+import pandas as pd
+import pyarrow as pa
+
+from companies.kpis import calculate_account_kpis
+from companies.labels import get_labels
+from companies.models import Address
+from .export_excel import HEADERS, KPI_COLUMNS, order_for_export
+
+CSV_CHUNK_SIZE = 5000
+# decimal(20, 2) like the AccountKPI fields, so CSV and Parquet keep every digit
+KPI_DTYPE = pd.ArrowDtype(pa.decimal128(20, 2))
+
+
+def companies_frame(companies):
+    """
+    Return the export columns of ``companies`` as a DataFrame with HEADERS as columns.
+
+    Built from two flat values() queries (companies with their stored KPIs,
+    and addresses) instead of model instances, so it scales to large lists.
+    Like ``Company.keyfigures`` in the Excel export, the KPIs of latest
+    accounts without an AccountKPI row are computed from their rubrics.
+    """
+    kpi_fields = [f"latest_account__kpi__{column}" for column in KPI_COLUMNS]
+    columns = [
+        'id', 'name', 'number', 'start_date', 'website', 'legalform_code',
+        'latest_account_id', 'latest_account__kpi__id', *kpi_fields,
+    ]
+    frame = pd.DataFrame.from_records(order_for_export(companies).values(*columns), columns=columns)
+
+    missing = frame['latest_account_id'].notna() & frame['latest_account__kpi__id'].isna()
+    if missing.any():
+        account_ids = frame.loc[missing, 'latest_account_id']
+        computed = calculate_account_kpis(set(account_ids.astype(int)))
+        for field, column in zip(kpi_fields, KPI_COLUMNS):
+            frame.loc[missing, field] = account_ids.map(lambda pk: (computed.get(pk) or {}).get(column))
+
+    # First address per company, as company.addresses.all()[0] in the Excel export
+    addresses = pd.DataFrame.from_records(
+        Address.objects.filter(company__in=companies.values('pk'))
+        .order_by('company_id', 'pk')
+        .values('company_id', 'street', 'house_number', 'postal_code', 'city'),
+        columns=['company_id', 'street', 'house_number', 'postal_code', 'city'],
+    ).drop_duplicates('company_id')
+    addresses['address'] = (
+        addresses['street'] + ' ' + addresses['house_number'] + ', '
+        + addresses['postal_code'] + ' ' + addresses['city']
+    )
+    frame = frame.merge(addresses[['company_id', 'address']], how='left', left_on='id', right_on='company_id')
+
+    labels = get_labels()
+    frame['legalform'] = frame['legalform_code'].map(lambda code: labels.get(("JuridicalForm", code)))
+    frame['start_date'] = pd.to_datetime(frame['start_date'])
+    for field in kpi_fields:
+        frame[field] = frame[field].astype(KPI_DTYPE)
+
+    frame = frame[['name', 'number', 'address', 'start_date', 'website', 'legalform', *kpi_fields]]
+    frame.columns = HEADERS
+    return frame
+
+
+def iter_csv(frame, chunk_size=CSV_CHUNK_SIZE):
+    """Yield ``frame`` as CSV text in chunks of rows, header first."""
+    for start in range(0, max(len(frame), 1), chunk_size):
+        yield frame.iloc[start:start + chunk_size].to_csv(index=False, header=start == 0)
@@ -4,12 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
 from companies.models import Company
-from .models import List, ListItem, Label, Municipality
-from .serializers import ListDetailSerializer, ListSummarySerializer, ListItemSerializer, LabelSerializer, MunicipalitySerializer
-from .utils.export_excel import generate_companies_excel
-from django.http import HttpResponse
+from .models import ExportJob, List, ListItem, Label, Municipality
+from .serializers import (
+    ListDetailSerializer, ListHeaderSerializer, ListSummarySerializer, ListItemSerializer, LabelSerializer,
+    MunicipalitySerializer,
+)
+from .filters import ListItemPagination, filter_list_items
+from .exports import export_key, get_job, open_artifact, start_job
+from .tasks import export_list_excel_task
+from .utils.export_frame import companies_frame, iter_csv
+from django.db.models import Count, Prefetch
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from companies.tasks import trigger_financial_import_task
 import pandas as pd
+import tempfile
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from rest_framework.parsers import MultiPartParser
 
@@ -18,13 +28,19 @@ class ListViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         qs = List.objects.all().order_by('-created_at')
+        # export_excel reads its companies in chunks itself
         if getattr(self, "action", None) in [
             "retrieve",
-            "export_excel",
         ]:
+            # One row per company for the key figures instead of every account's rubrics
             qs = qs.prefetch_related(
+                Prefetch(
+                    "items",
+                    queryset=ListItem.objects.select_related(
+                        "label", "company__latest_account__kpi"
+                    ).defer("company__latest_account__rubric_values"),
+                ),
                 "items__company__addresses",
-                "items__company__annual_accounts__financial_rubrics",
             )
         return qs
     
@@ -33,6 +49,37 @@ class ListViewSet(viewsets.ModelViewSet):
             return ListSummarySerializer  # define this separately
         return ListDetailSerializer
     
+    @action(detail=True, methods=['get'], url_path='header')
+    def header(self, request, slug=None):
+        """The list's own fields, labels and item count, without its items."""
+        list_instance = get_object_or_404(
+            List.objects.annotate(item_count=Count('items')).prefetch_related('labels'),
+            slug=slug,
+        )
+        return Response(ListHeaderSerializer(list_instance).data)
+
+    @action(detail=True, methods=['get'], url_path='items')
+    def items(self, request, slug=None):
+        """
+        Cursor-paginated items of the list.
+
+        Takes ``sort`` (name, number, created_at or a KPI such as turnover,
+        '-' for descending) and the filters of ``lists.filters.filter_list_items``.
+        """
+        list_instance = self.get_object()
+        items = (
+            ListItem.objects.filter(list=list_instance)
+            .select_related("label", "company__latest_account__kpi")
+            .defer("company__latest_account__rubric_values")
+            .prefetch_related("company__addresses")
+        )
+        items = filter_list_items(items, request.query_params)
+
+        paginator = ListItemPagination()
+        page = paginator.paginate_queryset(items, request, view=self)
+        serializer = ListItemSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post'], url_path='add-company')
     def add_company(self, request, slug=None):
         list_instance = self.get_object()
@@ -127,27 +174,113 @@ class ListViewSet(viewsets.ModelViewSet):
         
     @action(detail=True, methods=['post'], url_path='export-excel')
     def export_excel(self, request, slug=None):
+        """
+        Serve the stored export of this selection, or start building it.
+
+        Returns the workbook when an export of the same contents exists,
+        otherwise 202 with a job id to poll on export-jobs/<job_id>.
+        """
         list_instance = self.get_object()
+        company_numbers = self.selected_company_numbers(request, list_instance)
+        if not company_numbers:
+            return Response({'error': 'No companies found in the list.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        company_numbers = request.data.get('companies', None)
+        filename = f"lijst_{list_instance.slug}.xlsx"
+        key = export_key(list_instance, company_numbers)
+        response = self.export_file_response(key, filename)
+        if response is not None:
+            return response
 
-        if not company_numbers or not isinstance(company_numbers, list) or len(company_numbers) == 0:
-            company_numbers = list_instance.items.values_list('company__number', flat=True)
-            if company_numbers is None:
-                return Response({'error': 'No companies found in the list.'}, status=status.HTTP_400_BAD_REQUEST)
+        job, created = start_job(list_instance, key, filename)
+        if created:
+            export_list_excel_task.delay(job.id.hex, list_instance.id, company_numbers)
 
-        companies = Company.objects.filter(number__in=company_numbers)
-        
-        excel_file = generate_companies_excel(companies, list_instance.name)
-        
-        response = HttpResponse(
-            excel_file,
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            )
-        filename = f"lijst_{list_instance.slug}.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return Response(self.export_job_data(list_instance, job), status=status.HTTP_202_ACCEPTED)
 
+    @action(detail=True, methods=['post'], url_path='export-csv')
+    def export_csv(self, request, slug=None):
+        """Stream the export columns of the selection as CSV."""
+        list_instance = self.get_object()
+        company_numbers = self.selected_company_numbers(request, list_instance)
+        if not company_numbers:
+            return Response({'error': 'No companies found in the list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        frame = companies_frame(Company.objects.filter(number__in=company_numbers))
+        response = StreamingHttpResponse(iter_csv(frame), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="lijst_{list_instance.slug}.csv"'
         return response
+
+    @action(detail=True, methods=['post'], url_path='export-parquet')
+    def export_parquet(self, request, slug=None):
+        """Return the export columns of the selection as a Parquet file."""
+        list_instance = self.get_object()
+        company_numbers = self.selected_company_numbers(request, list_instance)
+        if not company_numbers:
+            return Response({'error': 'No companies found in the list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        frame = companies_frame(Company.objects.filter(number__in=company_numbers))
+        output = tempfile.TemporaryFile()
+        frame.to_parquet(output, engine='pyarrow', index=False)
+        output.seek(0)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f"lijst_{list_instance.slug}.parquet",
+            content_type='application/vnd.apache.parquet',
+        )
+
+    def selected_company_numbers(self, request, list_instance):
+        """Return the 'companies' numbers posted to an export, or every number in the list."""
+        company_numbers = request.data.get('companies', None)
+        if not company_numbers or not isinstance(company_numbers, list):
+            company_numbers = list(list_instance.items.values_list('company__number', flat=True))
+        return company_numbers
+
+    @action(detail=True, methods=['get'], url_path=r'export-jobs/(?P<job_id>[0-9a-f]+)')
+    def export_job(self, request, slug=None, job_id=None):
+        """Report an export job's progress; ?download=true returns the finished workbook."""
+        job = get_job(job_id)
+        if not job or not job.key.startswith(f"{slug}/"):
+            return Response({'error': 'Export job not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get('download') == 'true':
+            if job.status != ExportJob.DONE:
+                return Response({'error': 'Export is not ready yet.'}, status=status.HTTP_409_CONFLICT)
+            response = self.export_file_response(job.key, job.filename)
+            if response is None:
+                return Response(
+                    {'error': 'Export file has expired, start a new export.'}, status=status.HTTP_404_NOT_FOUND
+                )
+            return response
+
+        return Response(self.export_job_data(self.get_object(), job))
+
+    def export_job_data(self, list_instance, job):
+        job_id = job.id.hex
+        data = {
+            'job_id': job_id,
+            'status': job.status,
+            'processed': job.processed,
+            'total': job.total,
+            'error': job.error,
+        }
+        if job.status == ExportJob.DONE:
+            url = reverse('list-export-job', kwargs={'slug': list_instance.slug, 'job_id': job_id})
+            data['download_url'] = self.request.build_absolute_uri(f"{url}?download=true")
+        return data
+
+    def export_file_response(self, key, filename):
+        """Return the stored export as a download, or None when it is not (or no longer) stored."""
+        artifact = open_artifact(key)
+        if artifact is None:
+            return None
+        # FileResponse streams the file in blocks and closes it afterwards
+        return FileResponse(
+            artifact,
+            as_attachment=True,
+            filename=filename,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
     
     @action(detail=True, methods=['get'], url_path='labels')
     def get_labels(self, request, slug=None):
@@ -1,8 +1,11 @@
-import os
 import logging
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Lower
 from companies.models import Company, Address
+from companies.typeahead import publish_changes
 from rapidfuzz import fuzz
 import hashlib
 import re
@@ -12,11 +15,8 @@ logger = logging.getLogger(__name__)
 SUFFIX_PATTERN = r'\b(bvba|bv|nv|cvba|cv|vzw|sprl|srl|asbl|gmbh|sa|plc|ltd|llc)\b$'
 FUZZY_MATCH_THRESHOLD = 50
 CACHE_TIMEOUT = 3600  # seconds (1 hour)
-
-DEV_CACHE_DIR = "dev_api_cache"
-DEV_MODE = settings.DEBUG
-
-os.makedirs(DEV_CACHE_DIR, exist_ok=True)
+PLACES_CACHE_PREFIX = "places_search"
+PLACES_LANGUAGE = "nl"
 
 def parse_address_string(address_string):
     # Pre-clean: remove leading bus/unit if present
@@ -46,77 +46,130 @@ def normalize_name(name):
     return name
 
 
+def _match_on_address(candidates, name):
+    if len(candidates) == 1:
+        return candidates[0].company
+
+    matched_company = None
+    best_score = 0
+    for possible_address in candidates:
+        company_name = normalize_name(possible_address.company.name)
+        if company_name == name:
+            return possible_address.company
+
+        ratio = fuzz.WRatio(company_name, name)
+        if ratio > FUZZY_MATCH_THRESHOLD and ratio > best_score:
+            best_score = ratio
+            matched_company = possible_address.company
+    return matched_company
+
+
 def enrich_with_company_data(places_data):
-    enriched = []
+    """
+    Match a page of Google places to companies in a fixed number of queries.
 
+    All place ids, normalized names and (street, postal_code, house_number)
+    triples of the page are resolved with one query each, the fuzzy scoring
+    runs in memory and the maps_id/website writes go out as one bulk_update.
+    """
+    parsed = []
     for place in places_data:
-        matched_company = None
-        street = place.get("address", {}).get("street")
-        house_number = place.get("address", {}).get("number")
-        postal_code = place.get("address", {}).get("postcode")
-        name = normalize_name(place.get("name", ""))
-        place_id = place.get("place_id")
-        
-        if place_id:
-            matched_company = Company.objects.filter(maps_id=place_id).first()
-        
+        address = place.get("address", {})
+        street = address.get("street")
+        house_number = address.get("number")
+        postal_code = address.get("postcode")
+        parsed.append({
+            "place_id": place.get("place_id"),
+            "name": normalize_name(place.get("name") or ""),
+            "address_key": (
+                (street, postal_code, house_number)
+                if street and postal_code and house_number else None
+            ),
+        })
+
+    place_ids = {p["place_id"] for p in parsed if p["place_id"]}
+    by_maps_id = {}
+    if place_ids:
+        for company in Company.objects.filter(maps_id__in=place_ids):
+            by_maps_id.setdefault(company.maps_id, company)
+
+    # Same semantics as name__iexact, served by company_name_lower_idx
+    names = {p["name"] for p in parsed if p["name"]}
+    by_name = {}
+    if names:
+        named = Company.objects.annotate(name_lower=Lower("name")).filter(name_lower__in=names)
+        for company in named:
+            by_name.setdefault(company.name_lower, []).append(company)
+
+    address_keys = {p["address_key"] for p in parsed if p["address_key"]}
+    by_address = {}
+    if address_keys:
+        address_filter = Q()
+        for street, postal_code, house_number in address_keys:
+            address_filter |= Q(street=street, postal_code=postal_code, house_number=house_number)
+        for address in Address.objects.filter(address_filter).select_related("company").order_by("id"):
+            key = (address.street, address.postal_code, address.house_number)
+            by_address.setdefault(key, []).append(address)
+
+    enriched = []
+    to_update = {}
+
+    for place, info in zip(places_data, parsed):
+        place_id = info["place_id"]
+        matched_company = by_maps_id.get(place_id) if place_id else None
+
         if matched_company is None:
-            companies = Company.objects.filter(name__iexact=name)
-            company = companies.first()
-            if company and not companies[1:2].exists():  # ensures only one
-                matched_company = company
-            else:
-                if street and postal_code and house_number:
-                    possible_addresses = Address.objects.filter(
-                        street=street,
-                        postal_code=postal_code,
-                        house_number=house_number,
-                    ).select_related("company")
-                    print('Possible addresses: ', possible_addresses)
-                else:
-                    possible_addresses = Address.objects.none()
-                    
-                if possible_addresses.count() == 1:
-                    matched_company = possible_addresses.first().company
-                
-                elif possible_addresses.count() > 1:
-                    best_score = 0   
-                    for possible_address in possible_addresses:
-                        company_name = normalize_name(possible_address.company.name)
-                        if company_name == name:
-                            matched_company = possible_address.company
-                            break
-                        
-                        ratio = fuzz.WRatio(company_name, name)
-                        if ratio > FUZZY_MATCH_THRESHOLD and ratio > best_score:
-                            best_score = ratio
-                            matched_company = possible_address.company
-            
-                
+            companies = by_name.get(info["name"], [])
+            if len(companies) == 1:
+                matched_company = companies[0]
+            elif info["address_key"]:
+                candidates = by_address.get(info["address_key"], [])
+                if candidates:
+                    matched_company = _match_on_address(candidates, info["name"])
+
         result = {
             "company_name": matched_company.name if matched_company else None,
             "vat_number": matched_company.number if matched_company else None,
             "company_id": matched_company.id if matched_company else None,
         }
-        
+
         if matched_company and matched_company.maps_id != place_id:
-            company = Company.objects.filter(id=matched_company.id)
-            company.update(maps_id=place_id)
-            company.update(website=place.get("website"))
+            matched_company.maps_id = place_id
+            matched_company.website = place.get("website")
+            to_update[matched_company.id] = matched_company
 
         place.update(result)
         enriched.append(place)
 
+    if to_update:
+        Company.objects.bulk_update(to_update.values(), ["maps_id", "website"])
+        # Names and numbers are unchanged
+        publish_changes(())
+
     return enriched
 
-def get_dev_cache_path(textQuery, nextPageToken=None):
-    safe_text = re.sub(r'[^a-zA-Z0-9_-]', '_', textQuery)
-    safe_token = re.sub(r'[^a-zA-Z0-9_-]', '_', nextPageToken) if nextPageToken else ''
-    
-    base_string = f"{safe_text}_{safe_token}" if nextPageToken else safe_text
+def get_places_cache_key(textQuery, nextPageToken=None, languageCode=PLACES_LANGUAGE):
+    base_string = "|".join([textQuery.strip().lower(), nextPageToken or "", languageCode])
     hashed = hashlib.md5(base_string.encode('utf-8')).hexdigest()
-    
-    return os.path.join(DEV_CACHE_DIR, f"{hashed}.json")
+    return f"{PLACES_CACHE_PREFIX}:{hashed}"
+
+
+def cached_places_search(textQuery, nextPageToken=None, languageCode=PLACES_LANGUAGE):
+    """
+    Return the raw (not yet enriched) Places page for a query, served from the
+    shared cache when possible.
+
+    Enrichment is left to the caller so company matches, including the ones
+    corrected through set-vat, always come from the database.
+    """
+    cache_key = get_places_cache_key(textQuery, nextPageToken, languageCode)
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    data = GoogleMapsPlacesAPI(textQuery, nextPageToken, languageCode)
+    cache.set(cache_key, data, timeout=CACHE_TIMEOUT)
+    return data
 
 def GoogleMapsGeocodeAPI(address):
     
@@ -137,13 +190,7 @@ def GoogleMapsGeocodeAPI(address):
     return geometry
 
 
-def GoogleMapsPlacesAPI(textQuery, nextPageToken=None):
-    
-    # if DEV_MODE:
-    #     dev_cache_path = get_dev_cache_path(textQuery, latitude, longitude, radius, nextPageToken)
-    #     if os.path.exists(dev_cache_path):
-    #         with open(dev_cache_path, "r") as f:
-    #             return json.load(f)
+def GoogleMapsPlacesAPI(textQuery, nextPageToken=None, languageCode=PLACES_LANGUAGE):
 
     headers = {
         "Content-Type": "application/json",
@@ -154,13 +201,13 @@ def GoogleMapsPlacesAPI(textQuery, nextPageToken=None):
     if nextPageToken:
         payload = {
             "textQuery": textQuery,
-            "languageCode": "nl",
+            "languageCode": languageCode,
             "pageToken": nextPageToken
         }
     else:
         payload = {
             "textQuery": textQuery,
-            "languageCode": "nl",
+            "languageCode": languageCode,
         }
         
     print("Payload: ", payload)
@@ -217,8 +264,4 @@ def GoogleMapsPlacesAPI(textQuery, nextPageToken=None):
         "nextPageToken": data.get("nextPageToken"),
     }
 
-    # if DEV_MODE:
-    #     with open(get_dev_cache_path(textQuery, latitude, longitude, radius, nextPageToken), "w") as f:
-    #         json.dump(filtered_data, f, indent=2)
-
     return filtered_data
\ No newline at end of file
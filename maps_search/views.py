@@ -4,10 +4,10 @@ from rest_framework.decorators import action
 
 import time
 
-from django.core.cache import cache
 from companies.models import Company
+from companies.typeahead import publish_changes
 
-from maps_search.services import GoogleMapsPlacesAPI, enrich_with_company_data
+from maps_search.services import PLACES_LANGUAGE, cached_places_search, enrich_with_company_data
 from maps_search.serializers import GoogleMapsPlacesSerializer
 
 class GoogleMapsPlacesViewSet(ViewSet):
@@ -18,13 +18,14 @@ class GoogleMapsPlacesViewSet(ViewSet):
     def search(self, request):
         text_query = request.query_params.get('textQuery', '')
         next_page_token = request.query_params.get('nextPageToken', None)
+        language_code = request.query_params.get('languageCode', PLACES_LANGUAGE)
         print("next_page_token: ", next_page_token)
         if not text_query:
             return Response({"error": "textQuery parameter is required"}, status=400)
 
         try:
             start = time.time()
-            data = GoogleMapsPlacesAPI(text_query, next_page_token)
+            data = cached_places_search(text_query, next_page_token, language_code)
             print("Processing places took", time.time() - start, "seconds")
             
             start = time.time()
@@ -43,7 +44,6 @@ class GoogleMapsPlacesViewSet(ViewSet):
     def set_vat(self, request):
         vat_number = request.data.get('vat_number')
         place_id = request.data.get('place_id')
-        text_query = request.data.get('text_query')
         website = request.data.get('website', None)
 
         if not vat_number or not place_id:
@@ -55,23 +55,14 @@ class GoogleMapsPlacesViewSet(ViewSet):
             if not company:
                 return Response({"error": "Company not found with this VAT"}, status=404)
             
+            # Cached Places pages are enriched on every read, so moving the
+            # maps_id is enough for the correction to show up in later searches.
+            Company.objects.filter(maps_id=place_id).exclude(id=company.id).update(maps_id=None)
             company.maps_id = place_id
             company.website = website
             company.save()
-            
-            cache_key = f"places_search:{text_query.lower()}"
-            cached_data = cache.get(cache_key)
-            
-            if cached_data:
-                for place in cached_data:
-                    if place.get("place_id") == place_id:
-                        place.update({
-                            "company_id": company.id,
-                            "vat_number": company.number,
-                            "company_name": company.name,
-                        })
-                cache.set(cache_key, cached_data, timeout=3600)
-                
+            publish_changes(())
+
             enriched_place = {
                 "company_name": company.name,
                 "vat_number": company.number,